@@ -1,112 +1,153 @@
 from fastapi import APIRouter, HTTPException
-from app.models.models import AnswerRequest, RetrieveRequest, UploadRequest
-from app.services.answer_service import generate_answer
-from app.services.pdf_processor import download_pdf, extract_text_from_pdf
-from app.services.embeddings import create_embeddings
-from app.services.graph_service import CustomGraphService
-from app.utils.text_splitter import split_text
-from app.utils.config import db, Config
-import os
+from fastapi.responses import StreamingResponse
+from app.models.models import AnswerRequest, BatchAnswerRequest, RetrieveRequest, UploadRequest
+from app.services.answer_cache import answer_cache
+from app.services.answer_service import generate_answer, generate_answers, stream_answer
+from app.services.document_store import aget_document, delete_document
+from app.utils.config import Config
+from app.utils.embedding_cache import embedding_cache
+from app.utils.resources import get_ingestion
 import json
 import logging
-import pandas as pd
 
 router = APIRouter()
 LOG = logging.getLogger(__name__)
 
-graph_service = CustomGraphService(api_key=Config.OPENAI_API_KEY)
 
-
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_pdf(request: UploadRequest):
-    try:
-        pdf_path, document_id = download_pdf(request.url)
-        doc_text = extract_text_from_pdf(pdf_path)
+    job = await get_ingestion().submit(request.url)
+    return {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "message": "PDF queued for processing"
+    }
 
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error during PDF processing: {str(e)}")
 
-    chunks = split_text(doc_text)
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await get_ingestion().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job ID not found")
+    return job
+
 
+@router.post("/answer")
+async def answer_query(request: AnswerRequest):
     try:
-        knowledge_graph = await graph_service.create_knowledge_graph(document_id, chunks)
-        stats = graph_service.get_graph_statistics(knowledge_graph)
-        LOG.info("Graph created successfully with stats: %s", stats)
-        knowledge_graph_json = json.dumps(knowledge_graph)
+        document = await aget_document(request.document_id)
+        if document is None:
+            LOG.error("No document found for document_id: %s", request.document_id)
+            raise HTTPException(status_code=404, detail="Document ID not found")
+
+        answer = await generate_answer(request.document_id, request.query, document)
+
+        LOG.info("Successfully generated answer for document %s", request.document_id)
+        return {"answer": answer}
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create knowledge graph: {str(e)}")
+        LOG.error("Error generating answer: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate answer: {str(e)}"
+        )
+
 
+@router.post("/answer/stream")
+async def answer_query_stream(request: AnswerRequest):
+    """Server-sent events: `token` events as the answer is generated, optionally `replace`, then `done`."""
     try:
-        create_embeddings(document_id, chunks, knowledge_graph_json)
+        document = await aget_document(request.document_id)
+        if document is None:
+            LOG.error("No document found for document_id: %s", request.document_id)
+            raise HTTPException(status_code=404, detail="Document ID not found")
+
+        events = stream_answer(request.document_id, request.query, document)
+        # Retrieval and the graph query run here, so their errors still get a proper status code.
+        first = await events.__anext__()
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create embeddings: {str(e)}")
+        LOG.error("Error generating answer: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate answer: {str(e)}"
+        )
 
-    os.remove(pdf_path)
+    def sse(event: dict) -> str:
+        name = event.pop("event")
+        return f"event: {name}\ndata: {json.dumps(event)}\n\n"
 
-    return {
-        "document_id": document_id,
-        "message": "PDF processed, embeddings created, and knowledge graph built",
-        "graph_stats": stats
-    }
+    async def stream():
+        yield sse(first)
+        try:
+            async for event in events:
+                yield sse(event)
+        except Exception as e:
+            LOG.error("Error streaming answer: %s", str(e), exc_info=True)
+            yield sse({"event": "error", "detail": f"Failed to generate answer: {str(e)}"})
 
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-@router.post("/answer")
-async def answer_query(request: AnswerRequest):
-    try:
-        table = db.open_table('embeddings')
-        df = table.to_pandas()
-        document_rows = df[df['document_id'] == request.document_id]
 
-        if document_rows.empty:
-            LOG.error("No rows found for document_id: %s", request.document_id)
-            raise HTTPException(status_code=404, detail="Document ID not found")
+@router.post("/answer/batch")
+async def answer_queries(request: BatchAnswerRequest):
+    """Stream one JSON line per answer, in completion order, each tagged with its query's index."""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > Config.BATCH_ANSWER_MAX_QUERIES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {Config.BATCH_ANSWER_MAX_QUERIES} queries per request")
 
-        try:
-            first_row = document_rows.iloc[0]
-            LOG.debug("First row keys: %s", first_row.index.tolist())
-
-            if 'knowledge_graph' not in first_row:
-                LOG.error("knowledge_graph column not found in DataFrame")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Database schema error: knowledge_graph column not found"
-                )
-
-            knowledge_graph_json = first_row['knowledge_graph']
-
-            if pd.isna(knowledge_graph_json):
-                LOG.warning("knowledge_graph is None/NaN for document_id: %s", request.document_id)
-                knowledge_graph = {}  # Provide empty dict as fallback
-            else:
-                try:
-                    knowledge_graph = json.loads(knowledge_graph_json)
-                    LOG.debug("Successfully parsed knowledge graph JSON")
-                except json.JSONDecodeError as json_err:
-                    LOG.error("Failed to parse knowledge graph JSON: %s", str(json_err))
-                    raise HTTPException(
-                        status_code=500,
-                        detail="Invalid knowledge graph JSON format"
-                    )
-
-        except IndexError as idx_err:
-            LOG.error("Failed to access first row: %s", str(idx_err))
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to access document data"
-            )
-
-        LOG.debug("Generating answer with knowledge graph of size: %d bytes",
-                  len(str(knowledge_graph)))
-        answer = await generate_answer(request.document_id, knowledge_graph, request.query)
+    try:
+        document = await aget_document(request.document_id)
+        if document is None:
+            LOG.error("No document found for document_id: %s", request.document_id)
+            raise HTTPException(status_code=404, detail="Document ID not found")
 
-        LOG.info("Successfully generated answer for document %s", request.document_id)
-        return {"answer": answer}
+        answers = generate_answers(request.document_id, request.queries, document)
+        # Run the shared embedding/retrieval step now so its errors still get a proper status code.
+        first = await answers.__anext__()
 
+    except HTTPException:
+        raise
     except Exception as e:
-        LOG.error("Error generating answer: %s", str(e), exc_info=True)
+        LOG.error("Error generating answers: %s", str(e), exc_info=True)
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to generate answer: {str(e)}"
-        )
\ No newline at end of file
+            detail=f"Failed to generate answers: {str(e)}"
+        )
+
+    async def stream():
+        yield json.dumps(first) + "\n"
+        async for item in answers:
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.delete("/documents/{document_id}")
+async def remove_document(document_id: str):
+    try:
+        deleted = delete_document(document_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
+
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document ID not found")
+    answer_cache.invalidate(document_id)
+    return {"document_id": document_id, "message": "Document deleted"}
+
+
+@router.get("/embedding-cache/stats")
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+
+@router.get("/answer-cache/stats")
+async def answer_cache_stats():
+    return answer_cache.stats()
@@ -1,9 +1,15 @@
+from typing import List
+
 from pydantic import BaseModel
 
 class AnswerRequest(BaseModel):
     document_id: str
     query: str
 
+class BatchAnswerRequest(BaseModel):
+    document_id: str
+    queries: List[str]
+
 class RetrieveRequest(BaseModel):
     document_id: str
     query: str
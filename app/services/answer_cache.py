@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.utils.config import Config
+from app.utils.metrics import register_collector
+
+
+class _DocumentEntries:
+    """Cached answers of one document version, with query vectors packed in one matrix."""
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, version: Optional[str], dimension: int, limit: int):
+        self.version = version
+        capacity = min(self.INITIAL_CAPACITY, limit)
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.answers = [None] * capacity
+        self.size = 0
+
+    def grow(self, limit: int):
+        """Double the capacity (up to `limit`) so appends stay amortized O(1)."""
+        capacity = min(len(self.answers) * 2, limit)
+        extra = capacity - len(self.answers)
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.created = np.concatenate([self.created, np.zeros(extra)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+        self.answers.extend([None] * extra)
+
+
+class SemanticAnswerCache:
+    """
+    Per-document cache of answers keyed by query embedding.
+
+    A lookup returns the stored answer of the most similar cached question when
+    its cosine similarity reaches ANSWER_CACHE_THRESHOLD and it is younger than
+    ANSWER_CACHE_TTL_SECONDS. Each document keeps at most
+    ANSWER_CACHE_MAX_PER_DOCUMENT answers (least recently used evicted first),
+    and at most ANSWER_CACHE_MAX_DOCUMENTS documents are cached. Entries are
+    tied to the document version, so a re-upload makes them unreachable.
+    """
+
+    def __init__(self, threshold: float = None, ttl_seconds: float = None,
+                 max_per_document: int = None, max_documents: int = None):
+        self.threshold = threshold or Config.ANSWER_CACHE_THRESHOLD
+        self.ttl_seconds = ttl_seconds or Config.ANSWER_CACHE_TTL_SECONDS
+        self.max_per_document = max_per_document or Config.ANSWER_CACHE_MAX_PER_DOCUMENT
+        self.max_documents = max_documents or Config.ANSWER_CACHE_MAX_DOCUMENTS
+        self._documents: "OrderedDict[str, _DocumentEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, document_id: str, version: Optional[str], query_vector: np.ndarray) -> Optional[str]:
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is None or entries.version != version or entries.size == 0 \
+                    or entries.vectors.shape[1] != query_vector.shape[0]:
+                self.misses += 1
+                return None
+            self._documents.move_to_end(document_id)
+
+            n = entries.size
+            similarity = entries.vectors[:n] @ query_vector
+            similarity[now - entries.created[:n] > self.ttl_seconds] = -np.inf
+            best = int(np.argmax(similarity))
+            if similarity[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entries.last_used[best] = now
+            self.hits += 1
+            return entries.answers[best]
+
+    def put(self, document_id: str, version: Optional[str], query_vector: np.ndarray, answer: str):
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is None or entries.version != version or entries.vectors.shape[1] != query_vector.shape[0]:
+                entries = _DocumentEntries(version, query_vector.shape[0], self.max_per_document)
+                self._documents[document_id] = entries
+            self._documents.move_to_end(document_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+            if entries.size < self.max_per_document:
+                if entries.size == len(entries.answers):
+                    entries.grow(self.max_per_document)
+                slot = entries.size
+                entries.size += 1
+            else:
+                # Expired entries have the oldest timestamps, so they go first.
+                slot = int(np.argmin(entries.last_used[:entries.size]))
+
+            entries.vectors[slot] = query_vector
+            entries.created[slot] = now
+            entries.last_used[slot] = now
+            entries.answers[slot] = answer
+
+    def invalidate(self, document_id: str):
+        with self._lock:
+            self._documents.pop(document_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "documents": len(self._documents),
+                "entries": sum(entries.size for entries in self._documents.values())
+            }
+
+
+answer_cache = SemanticAnswerCache()
+
+
+def _collect_metrics():
+    stats = answer_cache.stats()
+    return [
+        ("graphrag_answer_cache_lookups_total", "counter", "Semantic answer cache lookups by result.", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "miss"}, stats["misses"])
+        ]),
+        ("graphrag_answer_cache_entries", "gauge", "Answers held by the semantic answer cache.",
+         [({}, stats["entries"])])
+    ]
+
+
+register_collector(_collect_metrics)
@@ -1,37 +1,193 @@
-from app.services.graph_service import CustomGraphService
-from app.services.query_handler import retrieve_similar_texts
+import asyncio
+import time
+
+from app.services.answer_cache import answer_cache
+from app.services.communities import is_global_query, load_community_summaries
+from app.services.context_packer import build_document_context, pack_graph_context
+from app.services.graph_index import load_graph_index
+from app.services.query_handler import retrieve_similar_texts_batch, search_similar_texts
+from app.utils.embedding_utils import aget_embedding, aget_embeddings
 from app.utils.config import Config
-from langchain_openai import ChatOpenAI
-from typing import Dict, List, Any
+from app.utils.metrics import LLM_CALL_SECONDS, LLM_ERRORS, llm_call, record_llm_usage, span
+from app.utils.openai_scheduler import chat_scheduler, estimate_chat_tokens, request_key, usage_tokens
+from app.utils.resources import get_graph_service, get_llm
+from typing import AsyncIterator, Dict, List, Any, Optional
 
-llm = ChatOpenAI(
-    openai_api_key=Config.OPENAI_API_KEY,
-    model_name="gpt-3.5-turbo",
-    temperature=0.7
-)
-graph_service = CustomGraphService(api_key=Config.OPENAI_API_KEY)
 
 
-async def generate_answer(document_id: str, knowledge_graph: Dict[str, Any], query: str) -> str:
+async def generate_answer(document_id: str, query: str, document: Dict[str, Any] = None) -> str:
     try:
-        top_results = retrieve_similar_texts(document_id=document_id, query=query, )
-        relevant_texts = [item['text'] for item in top_results]
-        context = "\n".join(relevant_texts)
+        document = document or {}
+        version = document.get('version')
+        query_vector = await aget_embedding(query)
+        if Config.ANSWER_CACHE_ENABLED:
+            cached = answer_cache.get(document_id, version, query_vector)
+            if cached is not None:
+                return cached
+
+        prompt = await _global_prompt(document_id, version, query, query_vector)
+        if prompt is None:
+            with span("retrieve"):
+                top_results = await search_similar_texts(document_id, query_vector,
+                                                         num_chunks=document.get('num_chunks'))
+                graph_index = await load_graph_index(document_id, version)
+            prompt = await _build_prompt(query, query_vector, top_results, graph_index)
+
+        answer = validate_and_format_answer(await generate_openai_response(prompt))
+        if Config.ANSWER_CACHE_ENABLED:
+            answer_cache.put(document_id, version, query_vector, answer)
+        return answer
+
+    except Exception as e:
+        return f"An error occurred while generating the answer: {str(e)}"
+
+
+async def generate_answers(document_id: str, queries: List[str],
+                           document: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answer several questions about one document, yielding each as it completes.
 
-        if knowledge_graph:
-            graph_results = await graph_service.query_knowledge_graph(knowledge_graph, query)
-            graph_context = format_graph_results(graph_results)
+    All queries are embedded in one batched request, retrieved together and
+    answered against a single load of the graph index; at most
+    BATCH_ANSWER_MAX_CONCURRENCY LLM calls run at once. Each item is
+    {"index", "query", "answer"}, where `index` is the query's position.
+    """
+    document = document or {}
+    version = document.get('version')
+    query_vectors = await aget_embeddings(queries)
+
+    cached, pending = [], []
+    for i, query in enumerate(queries):
+        answer = answer_cache.get(document_id, version, query_vectors[i]) if Config.ANSWER_CACHE_ENABLED else None
+        if answer is not None:
+            cached.append({"index": i, "query": query, "answer": answer})
         else:
-            graph_context = "No knowledge graph information available."
+            pending.append(i)
 
-        prompt = create_structured_prompt(context, graph_context, query)
+    # Shared work happens before the first yield, so its failures surface before streaming starts.
+    global_prompts = {}
+    for i in pending:
+        prompt = await _global_prompt(document_id, version, queries[i], query_vectors[i])
+        if prompt is not None:
+            global_prompts[i] = prompt
+    local = [i for i in pending if i not in global_prompts]
 
-        response = await generate_openai_response(prompt)
+    top_results, graph_index = {}, None
+    if local:
+        with span("retrieve"):
+            results = await retrieve_similar_texts_batch(
+                document_id, query_vectors[local], num_chunks=document.get('num_chunks')
+            )
+            top_results = dict(zip(local, results))
+            graph_index = await load_graph_index(document_id, version)
 
-        return validate_and_format_answer(response)
+    for item in cached:
+        yield item
+    if not pending:
+        return
+
+    semaphore = asyncio.Semaphore(Config.BATCH_ANSWER_MAX_CONCURRENCY)
+
+    async def answer_one(i: int) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                prompt = global_prompts.get(i) or await _build_prompt(queries[i], query_vectors[i],
+                                                                      top_results[i], graph_index)
+                answer = validate_and_format_answer(await generate_openai_response(prompt))
+            except Exception as e:
+                return {"index": i, "query": queries[i],
+                        "answer": f"An error occurred while generating the answer: {str(e)}"}
+        if Config.ANSWER_CACHE_ENABLED:
+            answer_cache.put(document_id, version, query_vectors[i], answer)
+        return {"index": i, "query": queries[i], "answer": answer}
+
+    tasks = [asyncio.create_task(answer_one(i)) for i in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client may disconnect mid-stream; don't leave LLM calls running.
+        for task in tasks:
+            task.cancel()
 
-    except Exception as e:
-        return f"An error occurred while generating the answer: {str(e)}"
+
+async def _global_prompt(document_id: str, version: str, query: str, query_vector) -> Optional[str]:
+    """
+    Prompt answering a question about the whole document from its community
+    summaries; None for other questions, or when the document has no summaries.
+    """
+    if not Config.COMMUNITIES_ENABLED or not is_global_query(query):
+        return None
+    with span("communities"):
+        summaries = await load_community_summaries(document_id, version)
+    if not summaries:
+        return None
+    return create_global_prompt(summaries.context(query_vector, Config.CONTEXT_TOKEN_BUDGET), query)
+
+
+async def _build_prompt(query: str, query_vector, top_results: List[Dict[str, Any]], graph_index) -> str:
+    """Fill the prompt with graph and document context within CONTEXT_TOKEN_BUDGET tokens."""
+    budget = Config.CONTEXT_TOKEN_BUDGET
+    graph_tokens = 0
+    if graph_index:
+        with span("graph_query"):
+            graph_results = await get_graph_service().query_knowledge_graph(
+                {}, query, query_vector=query_vector, index=graph_index
+            )
+        graph_context, graph_tokens = pack_graph_context(
+            [format_graph_results([result]) for result in graph_results], int(budget * Config.CONTEXT_GRAPH_SHARE)
+        )
+        graph_context = graph_context or format_graph_results([])
+    else:
+        graph_context = "No knowledge graph information available."
+
+    # The document gets whatever the graph context left of the budget.
+    with span("pack_context"):
+        context = await build_document_context(query_vector, top_results, budget - graph_tokens)
+
+    return create_structured_prompt(context, graph_context, query)
+
+
+async def stream_answer(document_id: str, query: str,
+                        document: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answer `query` as a stream of events, forwarding the LLM's tokens as they arrive.
+
+    Retrieval and the graph query finish before the first event. Events are
+    {"event": "token", "text"} for each piece of the answer, then optionally
+    {"event": "replace", "answer"} when the full answer would have been
+    replaced by `validate_and_format_answer`, then {"event": "done", "answer"}
+    with the final answer.
+    """
+    document = document or {}
+    version = document.get('version')
+    query_vector = await aget_embedding(query)
+    if Config.ANSWER_CACHE_ENABLED:
+        cached = answer_cache.get(document_id, version, query_vector)
+        if cached is not None:
+            yield {"event": "token", "text": cached}
+            yield {"event": "done", "answer": cached}
+            return
+
+    prompt = await _global_prompt(document_id, version, query, query_vector)
+    if prompt is None:
+        with span("retrieve"):
+            top_results = await search_similar_texts(document_id, query_vector,
+                                                     num_chunks=document.get('num_chunks'))
+            graph_index = await load_graph_index(document_id, version)
+        prompt = await _build_prompt(query, query_vector, top_results, graph_index)
+
+    validator = AnswerValidator()
+    async for text in stream_openai_response(prompt):
+        validator.feed(text)
+        yield {"event": "token", "text": text}
+
+    answer = validator.answer()
+    if validator.insufficient:
+        yield {"event": "replace", "answer": answer}
+    if Config.ANSWER_CACHE_ENABLED:
+        answer_cache.put(document_id, version, query_vector, answer)
+    yield {"event": "done", "answer": answer}
 
 
 def format_graph_results(graph_results: List[Dict[str, Any]]) -> str:
@@ -78,28 +234,120 @@ Please provide your answer:
 """
 
 
-async def generate_openai_response(prompt: str) -> str:
-    messages = [
+def create_global_prompt(summaries: str, query: str) -> str:
+    return f"""
+You are an AI assistant helping with learning materials. Answer the following question about the document as a whole, using the summaries of its main topics.
+
+Topics of the Document:
+{summaries}
+
+Question:
+{query}
+
+Instructions:
+1. Give an overview that covers the topics relevant to the question, most important first
+2. Explain how the topics relate to each other where the summaries show it
+3. Answer in a clear, motivational, and pedagogical tone
+4. If you cannot find sufficient information to answer the question, please explicitly state so
+
+Please provide your answer:
+"""
+
+
+def _answer_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
         {"role": "system",
          "content": "You are a knowledgeable educational assistant that provides accurate, well-structured answers based on provided information."},
         {"role": "user", "content": prompt}
     ]
 
-    response = await llm.ainvoke(messages)
+
+async def generate_openai_response(prompt: str) -> str:
+    messages = _answer_messages(prompt)
+
+    async def request():
+        with llm_call("answer"):
+            response = await get_llm().ainvoke(messages)
+        record_llm_usage("answer", response)
+        return response
+
+    response = await chat_scheduler.call(request, estimate_chat_tokens(messages),
+                                         key=request_key("answer", messages), usage=usage_tokens)
     return response.content.strip()
 
 
+async def stream_openai_response(prompt: str) -> AsyncIterator[str]:
+    """Yield the response text piece by piece, without leading whitespace."""
+    # Timed by hand: a span's context cannot stay open across the generator's yields.
+    messages = _answer_messages(prompt)
+    estimated = estimate_chat_tokens(messages)
+    used = None
+    start = time.perf_counter()
+    started = False
+    try:
+        async with chat_scheduler.slot(estimated):
+            start = time.perf_counter()
+            async for chunk in get_llm().astream(messages):
+                record_llm_usage("answer_stream", chunk)
+                used = usage_tokens(chunk) or used
+                text = chunk.content
+                if not started:
+                    text = text.lstrip()
+                    started = bool(text)
+                if text:
+                    yield text
+        chat_scheduler.settle(estimated, used)
+    except Exception:
+        LLM_ERRORS.inc(operation="answer_stream")
+        raise
+    finally:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, operation="answer_stream")
+
+
+INSUFFICIENT_INFO_PHRASES = [
+    "cannot answer",
+    "don't have enough information",
+    "insufficient information",
+    "cannot determine",
+    "not enough context"
+]
+INSUFFICIENT_INFO_ANSWER = "I apologize, but I cannot provide a complete answer based on the available information in the document and knowledge graph."
+
+
 def validate_and_format_answer(response: str) -> str:
     """Validate the response and format it appropriately"""
-    insufficient_info_phrases = [
-        "cannot answer",
-        "don't have enough information",
-        "insufficient information",
-        "cannot determine",
-        "not enough context"
-    ]
+    if any(phrase in response.lower() for phrase in INSUFFICIENT_INFO_PHRASES):
+        return INSUFFICIENT_INFO_ANSWER
+
+    return response
+
+
+class AnswerValidator:
+    """
+    Incremental `validate_and_format_answer` for streamed responses.
+
+    Each piece is checked together with the last few characters seen before
+    it, so a phrase split across pieces is still found while every character
+    is scanned only a bounded number of times.
+    """
+
+    _WINDOW = max(len(phrase) for phrase in INSUFFICIENT_INFO_PHRASES) - 1
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.insufficient = False
+        self._tail = ""
 
-    if any(phrase in response.lower() for phrase in insufficient_info_phrases):
-        return "I apologize, but I cannot provide a complete answer based on the available information in the document and knowledge graph."
+    def feed(self, text: str):
+        self.parts.append(text)
+        if self.insufficient:
+            return
+        window = self._tail + text.lower()
+        if any(phrase in window for phrase in INSUFFICIENT_INFO_PHRASES):
+            self.insufficient = True
+        self._tail = window[-self._WINDOW:]
 
-    return response
\ No newline at end of file
+    def answer(self) -> str:
+        if self.insufficient:
+            return INSUFFICIENT_INFO_ANSWER
+        return "".join(self.parts).strip()
@@ -0,0 +1,363 @@
+"""
+Graph communities and their summaries, for whole-document questions.
+
+After a document's graph is stored, its entities are partitioned with label
+propagation over the CSR adjacency of its GraphIndex. Each community big
+enough to matter is summarized once by the LLM, and the summaries are stored
+with their embeddings in the `communities` table. Broad questions ("what is
+this document about?") are then answered from a few of those summaries
+instead of from five chunks and ten graph nodes.
+"""
+import asyncio
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from app.services.embeddings import vectors_to_arrow
+from app.services.graph_index import GraphIndex
+from app.services.graph_store import get_cached_graph, node_chunk_indices
+from app.services.index_manager import document_filter, ensure_indexes
+from app.utils.config import Config
+from app.utils.embedding_utils import aget_embeddings
+from app.utils.metrics import llm_call, record_llm_usage
+from app.utils.openai_scheduler import chat_scheduler, estimate_chat_tokens, request_key, usage_tokens
+from app.utils.resources import get_db, get_graph_service
+from app.utils.text_splitter import count_tokens
+
+LOG = logging.getLogger(__name__)
+
+COMMUNITIES_TABLE = 'communities'
+
+# Phrasings of a question about the document as a whole rather than about something in it.
+GLOBAL_QUERY_PATTERN = re.compile(
+    r"\b(what('s| is| are) (this|the) (document|paper|text|book|article|report)s? about"
+    r"|summar(y|ies|ize|ise)"
+    r"|overview"
+    r"|(main|key|central|major|overall) (topics?|themes?|ideas?|points?|takeaways?|findings?|subjects?"
+    r"|messages?|arguments?|conclusions?|contributions?)"
+    r"|(whole|entire) (document|paper|text|book|article|report))\b",
+    re.IGNORECASE
+)
+
+# Everything else a broad question may be made of ("Can you give me a short
+# overview of this paper?"). Any other word names something specific, as in
+# "What are the main findings of the second experiment?".
+_BROAD_QUESTION_WORDS = frozenset("""
+a an the this that these it its of in on about for from to and or s
+me us you i we can could would will please give provide tell write show list describe explain
+what which is are was were be do does did
+document documents paper papers text book article report whole entire
+short brief quick general high level overall
+summary summaries summarize summarise overview main key central major
+topic topics theme themes idea ideas point points takeaway takeaways finding findings subject subjects
+message messages argument arguments conclusion conclusions contribution contributions
+""".split())
+_WORD = re.compile(r"[a-z]+|\d+")
+
+# Entities and relationships of a community shown to the LLM, most connected first.
+_PROMPT_ENTITIES = 40
+_PROMPT_RELATIONSHIPS = 60
+
+
+class CommunityException(Exception):
+    """Custom exception for community detection and summary errors"""
+    pass
+
+
+def is_global_query(query: str) -> bool:
+    """True for a broad question about the whole document, with nothing more specific in it."""
+    if not GLOBAL_QUERY_PATTERN.search(query):
+        return False
+    return all(word in _BROAD_QUESTION_WORDS for word in _WORD.findall(query.lower()))
+
+
+def detect_communities(index: GraphIndex, max_iterations: int = None, seed: int = 0) -> np.ndarray:
+    """
+    Partition the graph's nodes with weighted label propagation.
+
+    Every node starts in its own community and repeatedly adopts the label
+    carrying the most edge weight among its neighbours, keeping its own on a
+    tie. Each round updates a random half of the nodes, which stops two
+    groups from swapping labels forever.
+
+    Returns:
+        np.ndarray: Community of each node, numbered 0.. from the largest
+    """
+    n = len(index)
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0 or len(index.neighbors) == 0:
+        return labels
+    max_iterations = max_iterations or Config.COMMUNITY_MAX_ITERATIONS
+    rng = np.random.default_rng(seed)
+
+    heads = np.repeat(np.arange(n, dtype=np.int64), np.diff(index.indptr))
+    tails = index.neighbors
+    weights = index.edge_weights.astype(np.float64)
+
+    for _ in range(max_iterations):
+        # Total weight from each node to each label around it.
+        keys, inverse = np.unique(heads * n + labels[tails], return_inverse=True)
+        totals = np.bincount(inverse, weights=weights)
+        key_heads, key_labels = keys // n, keys % n
+
+        current = np.zeros(n)
+        own = key_labels == labels[key_heads]
+        current[key_heads[own]] = totals[own]
+
+        # Strongest label per node, ties broken at random.
+        order = np.lexsort((-(totals + rng.random(len(totals)) * 1e-9), key_heads))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key_heads[order][1:] != key_heads[order][:-1]
+        best = order[first]
+        candidates = key_heads[best]
+        better = totals[best] > current[candidates] + 1e-9
+        if not better.any():
+            break
+        update = better & (rng.random(len(best)) < 0.5)
+        labels[candidates[update]] = key_labels[best[update]]
+
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=np.int64)
+    rank[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+    return rank[inverse]
+
+
+def _describe_community(index: GraphIndex, members: np.ndarray) -> str:
+    """Entities (`members`, most connected first) and internal relationships of a community, as LLM prompt text."""
+    entities = [f"{index.nodes[i]['name']} ({index.nodes[i]['type']})" for i in members[:_PROMPT_ENTITIES]]
+
+    inside = np.zeros(len(index), dtype=bool)
+    inside[members] = True
+    relationships = []
+    for head in members:
+        for offset in range(index.indptr[head], index.indptr[head + 1]):
+            if index.edge_forward[offset] and inside[index.neighbors[offset]]:
+                relationships.append(index.describe_edge(offset))
+        if len(relationships) >= _PROMPT_RELATIONSHIPS:
+            break
+
+    return "Entities: " + ", ".join(entities) + "\nRelationships:\n" + "\n".join(relationships[:_PROMPT_RELATIONSHIPS])
+
+
+async def _summarize(description: str) -> str:
+    messages = [
+        {"role": "system",
+         "content": "You summarize parts of a document from the entities and relationships extracted from it."},
+        {"role": "user", "content": f"""
+The following entities and relationships form one topic of a document.
+
+{description}
+
+In 3 to 5 sentences, describe what this topic is about and how the main entities relate to each other.
+Only use the information above.
+"""}
+    ]
+
+    async def request():
+        with llm_call("community_summary"):
+            response = await get_graph_service().llm.ainvoke(messages)
+        record_llm_usage("community_summary", response)
+        return response
+
+    response = await chat_scheduler.call(request, estimate_chat_tokens(messages),
+                                         key=request_key("community_summary", messages), usage=usage_tokens)
+    return response.content.strip()
+
+
+async def summarize_communities(index: GraphIndex, labels: np.ndarray,
+                                previous: Dict[str, str] = None) -> List[Dict[str, Any]]:
+    """
+    Summarize the COMMUNITY_MAX_COUNT largest communities with at least
+    COMMUNITY_MIN_SIZE entities. A community whose summary fails is skipped.
+
+    `previous` maps description fingerprints to summaries stored before; a
+    community described exactly like one of them keeps its summary.
+    """
+    previous = previous or {}
+    sizes = np.bincount(labels) if len(labels) else np.zeros(0, dtype=np.int64)
+    chosen = [c for c in range(min(len(sizes), Config.COMMUNITY_MAX_COUNT)) if sizes[c] >= Config.COMMUNITY_MIN_SIZE]
+    semaphore = asyncio.Semaphore(Config.GRAPH_EXTRACTION_CONCURRENCY)
+    degree = np.diff(index.indptr)
+
+    async def summarize(community: int) -> Optional[Dict[str, Any]]:
+        members = np.flatnonzero(labels == community)
+        members = members[np.argsort(-degree[members], kind='stable')]
+        description = _describe_community(index, members)
+        fingerprint = request_key("community_summary", description)
+        try:
+            summary = previous.get(fingerprint)
+            if summary is None:
+                async with semaphore:
+                    summary = await _summarize(description)
+        except Exception as e:
+            LOG.warning("Failed to summarize community %d: %s", community, str(e))
+            return None
+        chunk_indices = sorted({i for m in members for i in node_chunk_indices(index.nodes[m])})
+        return {
+            'community': community,
+            'title': ", ".join(index.nodes[m]['name'] for m in members[:3]),
+            'summary': summary,
+            'size': len(members),
+            'entities': [index.nodes[m]['name'] for m in members],
+            'chunk_indices': chunk_indices,
+            'fingerprint': fingerprint
+        }
+
+    results = await asyncio.gather(*(summarize(c) for c in chosen))
+    return [result for result in results if result is not None]
+
+
+def _communities_schema(dimension: int) -> pa.Schema:
+    return pa.schema([
+        pa.field("document_id", pa.string()),
+        pa.field("community", pa.int32()),
+        pa.field("title", pa.string()),
+        pa.field("summary", pa.string()),
+        pa.field("size", pa.int32()),
+        pa.field("entities", pa.list_(pa.string())),
+        pa.field("chunk_indices", pa.list_(pa.int32())),
+        pa.field("vector", pa.list_(pa.float32(), dimension)),
+        pa.field("fingerprint", pa.string())
+    ])
+
+
+def save_communities(document_id: str, communities: List[Dict[str, Any]], vectors: np.ndarray):
+    """Store a document's community summaries, replacing any previous ones."""
+    try:
+        db = get_db()
+        if COMMUNITIES_TABLE in db.table_names():
+            table = db.open_table(COMMUNITIES_TABLE)
+            table.delete(document_filter(document_id))
+            if "fingerprint" not in table.schema.names:
+                table.add_columns([pa.field("fingerprint", pa.string())])
+        elif communities:
+            table = db.create_table(COMMUNITIES_TABLE, schema=_communities_schema(vectors.shape[1]), exist_ok=True)
+        if not communities:
+            return
+
+        table.add(pa.table({
+            "document_id": pa.array([document_id] * len(communities), type=pa.string()),
+            "community": pa.array([c['community'] for c in communities], type=pa.int32()),
+            "title": pa.array([c['title'] for c in communities], type=pa.string()),
+            "summary": pa.array([c['summary'] for c in communities], type=pa.string()),
+            "size": pa.array([c['size'] for c in communities], type=pa.int32()),
+            "entities": pa.array([c['entities'] for c in communities], type=pa.list_(pa.string())),
+            "chunk_indices": pa.array([c['chunk_indices'] for c in communities], type=pa.list_(pa.int32())),
+            "vector": vectors_to_arrow(vectors),
+            "fingerprint": pa.array([c.get('fingerprint') for c in communities], type=pa.string())
+        }).select(table.schema.names).cast(table.schema))
+        ensure_indexes(table, ["document_id"])
+
+    except Exception as e:
+        raise CommunityException(f"Failed to save communities: {str(e)}")
+
+
+def _stored_summaries(document_id: str) -> Dict[str, str]:
+    """Summaries stored for a document, by the fingerprint of the description they were made from."""
+    if COMMUNITIES_TABLE not in get_db().table_names():
+        return {}
+    table = get_db().open_table(COMMUNITIES_TABLE)
+    if "fingerprint" not in table.schema.names:
+        return {}
+    rows = table.search().where(document_filter(document_id)).select(
+        ["fingerprint", "summary"]
+    ).limit(None).to_arrow()
+    return {fingerprint: summary for fingerprint, summary in
+            zip(rows.column("fingerprint").to_pylist(), rows.column("summary").to_pylist()) if fingerprint}
+
+
+async def build_communities(document_id: str, index: GraphIndex) -> int:
+    """
+    Detect, summarize, embed and store the communities of a document's graph.
+
+    When the document is re-ingested, communities that did not change keep
+    their stored summary instead of being summarized again.
+
+    Returns:
+        int: Number of community summaries stored
+    """
+    try:
+        labels = await asyncio.to_thread(detect_communities, index)
+        previous = await asyncio.to_thread(_stored_summaries, document_id)
+        communities = await summarize_communities(index, labels, previous)
+        vectors = await aget_embeddings([c['summary'] for c in communities]) if communities else None
+        await asyncio.to_thread(save_communities, document_id, communities, vectors)
+        LOG.info("Stored %d community summaries for document %s (%d communities found, %d summaries reused)",
+                 len(communities), document_id, int(labels.max()) + 1 if len(labels) else 0,
+                 sum(1 for c in communities if c['fingerprint'] in previous))
+        return len(communities)
+
+    except CommunityException:
+        raise
+    except Exception as e:
+        raise CommunityException(f"Failed to build communities: {str(e)}")
+
+
+def delete_communities(document_id: str):
+    try:
+        if COMMUNITIES_TABLE in get_db().table_names():
+            get_db().open_table(COMMUNITIES_TABLE).delete(document_filter(document_id))
+    except Exception as e:
+        raise CommunityException(f"Failed to delete communities: {str(e)}")
+
+
+class CommunitySummaries:
+    """A document's community summaries with their L2-normalized embeddings."""
+
+    def __init__(self, rows: List[Dict[str, Any]], vectors: np.ndarray):
+        self.rows = rows
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True) if len(rows) else None
+        self.vectors = vectors / np.where(norms == 0, 1.0, norms) if len(rows) else vectors
+        self.sizes = np.array([row['size'] for row in rows], dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def context(self, query_vector: np.ndarray, budget: int) -> str:
+        """
+        Summaries ranked by relevance to the query plus relative community size,
+        as many as fit in `budget` tokens.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        scores = self.vectors @ query_vector + np.log1p(self.sizes) / np.log1p(self.sizes.max())
+
+        kept = []
+        used = 0
+        for i in np.argsort(-scores, kind='stable'):
+            row = self.rows[i]
+            block = f"Topic: {row['title']} ({row['size']} entities)\n{row['summary']}"
+            tokens = count_tokens(block) + 2
+            if used + tokens <= budget:
+                kept.append(block)
+                used += tokens
+        return "\n\n".join(kept)
+
+
+def _load_summaries(document_id: str, version: Optional[str]) -> Optional[CommunitySummaries]:
+    entry = get_cached_graph(document_id, version)
+    if entry is None:
+        return None
+    if 'communities' not in entry:
+        summaries = None
+        if COMMUNITIES_TABLE in get_db().table_names():
+            rows = get_db().open_table(COMMUNITIES_TABLE).search().where(
+                document_filter(document_id)
+            ).select(["title", "summary", "size", "vector"]).limit(None).to_arrow()
+            if rows.num_rows:
+                vectors = np.asarray(rows.column("vector").combine_chunks().flatten(), dtype=np.float32)
+                summaries = CommunitySummaries(rows.drop_columns(["vector"]).to_pylist(),
+                                               vectors.reshape(rows.num_rows, -1))
+        entry['communities'] = summaries
+    return entry['communities']
+
+
+async def load_community_summaries(document_id: str, version: Optional[str] = None) -> Optional[CommunitySummaries]:
+    """A document's community summaries (None if it has none), cached with its graph."""
+    try:
+        return await asyncio.to_thread(_load_summaries, document_id, version)
+    except Exception as e:
+        raise CommunityException(f"Failed to load communities: {str(e)}")
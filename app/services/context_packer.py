@@ -0,0 +1,115 @@
+"""
+Token-budgeted context for answer prompts.
+
+Retrieved chunks hold up to 5000 tokens each, so sending the top ones whole
+costs tens of thousands of prompt tokens per question. Instead each chunk is
+cut into short passages, the passages are scored against the question's
+embedding, near-duplicates (such as the overlap between consecutive chunks)
+are dropped, and the best passages are packed into a fixed token budget that
+the document shares with the knowledge-graph context.
+"""
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.config import Config
+from app.utils.embedding_utils import aget_embeddings
+from app.utils.text_splitter import count_tokens, split_passages
+
+
+@lru_cache(maxsize=4096)
+def _passages(text: str, max_tokens: int) -> Tuple[Tuple[str, int], ...]:
+    # Popular chunks are retrieved again and again; tokenize them once.
+    return tuple(split_passages(text, max_tokens))
+
+
+def select_passages(query_vector: np.ndarray, vectors: np.ndarray, tokens: np.ndarray, budget: int,
+                    dedup_similarity: float) -> List[int]:
+    """
+    Greedily pick the passages most similar to the query that fit in `budget`.
+
+    A passage at least `dedup_similarity` similar to one already picked is
+    skipped, as is one that would overflow the budget (a shorter, lower
+    scoring one may still fit).
+
+    Returns:
+        List[int]: Row indices of the picked passages, best first
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+
+    scores = vectors @ query_vector
+    similar = (vectors @ vectors.T) >= dedup_similarity
+    blocked = np.zeros(len(vectors), dtype=bool)
+    smallest = int(tokens.min())
+
+    selected = []
+    used = 0
+    for i in np.argsort(-scores, kind='stable'):
+        if blocked[i] or used + tokens[i] > budget:
+            continue
+        selected.append(int(i))
+        used += int(tokens[i])
+        blocked |= similar[i]
+        if budget - used < smallest:
+            break
+    return selected
+
+
+async def build_document_context(query_vector: np.ndarray, top_results: List[Dict[str, Any]],
+                                 budget: int = None) -> str:
+    """
+    Join the passages of `top_results` that best answer the query, in document
+    order, in at most `budget` tokens (CONTEXT_TOKEN_BUDGET by default).
+
+    Passage embeddings go through the embedding cache, so chunks that are
+    retrieved often are only embedded once.
+    """
+    budget = Config.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    split = await asyncio.to_thread(
+        lambda: [_passages(item['text'], Config.CONTEXT_PASSAGE_TOKENS) for item in top_results]
+    )
+
+    # (chunk index, position in chunk, text, tokens including the separator)
+    pieces = []
+    seen = set()
+    for rank, (item, passages) in enumerate(zip(top_results, split)):
+        for position, (text, tokens) in enumerate(passages):
+            if text not in seen:
+                seen.add(text)
+                pieces.append((item.get('chunk_index', rank), position, text, tokens + 1))
+    if not pieces:
+        return ""
+
+    tokens = np.array([piece[3] for piece in pieces])
+    if tokens.sum() <= budget:
+        selected = list(range(len(pieces)))
+    else:
+        vectors = await aget_embeddings([piece[2] for piece in pieces])
+        selected = select_passages(query_vector, vectors, tokens, budget, Config.CONTEXT_DEDUP_SIMILARITY)
+
+    # Document order reads better than score order.
+    selected.sort(key=lambda i: pieces[i][:2])
+    return "\n".join(pieces[i][2] for i in selected)
+
+
+def pack_graph_context(blocks: Sequence[str], budget: int) -> Tuple[str, int]:
+    """
+    Keep the formatted graph results (best first) that fit in `budget` tokens.
+
+    Returns:
+        Tuple[str, int]: The joined blocks and the tokens they use
+    """
+    kept = []
+    used = 0
+    for block in blocks:
+        tokens = count_tokens(block) + 1
+        if used + tokens <= budget:
+            kept.append(block)
+            used += tokens
+    return "\n".join(kept), used
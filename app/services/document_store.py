@@ -0,0 +1,186 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+
+from app.services.communities import delete_communities
+from app.services.embeddings import EMBEDDINGS_TABLE
+from app.services.graph_store import delete_graph
+from app.services.index_manager import document_filter, ensure_scalar_indexes, quote
+from app.utils.resources import get_async_db, get_db
+
+LOG = logging.getLogger(__name__)
+
+DOCUMENTS_TABLE = 'documents'
+
+DOCUMENTS_SCHEMA = pa.schema([
+    pa.field("document_id", pa.string()),
+    pa.field("version", pa.string()),
+    pa.field("num_chunks", pa.int32()),
+    pa.field("num_nodes", pa.int32()),
+    pa.field("num_edges", pa.int32()),
+    pa.field("updated_at", pa.string()),
+    pa.field("metadata", pa.string()),
+    pa.field("content_hash", pa.string()),
+    pa.field("url", pa.string())
+])
+
+# Columns added after the table was first created; `add_document_fingerprints` adds them to older tables.
+FINGERPRINT_FIELDS = [pa.field("content_hash", pa.string()), pa.field("url", pa.string())]
+
+
+class DocumentStoreException(Exception):
+    """Custom exception for document metadata errors"""
+    pass
+
+
+def register_document(document_id: str, num_chunks: int, graph: Dict[str, Any],
+                      content_hash: str = None, url: str = None) -> str:
+    """
+    Insert or replace the metadata row for a document.
+
+    Every call assigns a new version, which readers use to tell whether
+    anything they cached for the document is stale. `content_hash` and `url`
+    identify the uploaded file, so the same file is not ingested twice.
+
+    Returns:
+        str: The new version of the document
+    """
+    try:
+        version = uuid.uuid4().hex
+        row = pa.table({
+            "document_id": [document_id],
+            "version": [version],
+            "num_chunks": pa.array([num_chunks], type=pa.int32()),
+            "num_nodes": pa.array([len(graph.get('nodes', []))], type=pa.int32()),
+            "num_edges": pa.array([len(graph.get('edges', []))], type=pa.int32()),
+            "updated_at": [datetime.now().isoformat()],
+            "metadata": [json.dumps(graph.get('metadata', {}))],
+            "content_hash": pa.array([content_hash], type=pa.string()),
+            "url": pa.array([url], type=pa.string())
+        }, schema=DOCUMENTS_SCHEMA)
+
+        db = get_db()
+        if DOCUMENTS_TABLE in db.table_names():
+            table = db.open_table(DOCUMENTS_TABLE)
+        else:
+            table = db.create_table(DOCUMENTS_TABLE, schema=DOCUMENTS_SCHEMA, exist_ok=True)
+        missing = set(row.schema.names) - set(table.schema.names)
+        if missing:
+            LOG.warning("Table %s has no %s column(s); run `python -m app.services.migrations` to add them",
+                        DOCUMENTS_TABLE, sorted(missing))
+            row = row.drop_columns(sorted(missing))
+        table.merge_insert("document_id").when_matched_update_all().when_not_matched_insert_all().execute(row)
+        ensure_scalar_indexes(table, [name for name in ("document_id", "content_hash", "url")
+                                      if name in table.schema.names])
+        return version
+
+    except Exception as e:
+        raise DocumentStoreException(f"Failed to register document: {str(e)}")
+
+
+def get_document(document_id: str) -> Optional[Dict[str, Any]]:
+    """Return the metadata row for a document, or None if it was never ingested."""
+    try:
+        return _find_document(document_filter(document_id))
+
+    except Exception as e:
+        raise DocumentStoreException(f"Failed to look up document: {str(e)}")
+
+
+def find_document(content_hash: str = None, url: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Return the metadata row of the document ingested from a file with
+    `content_hash`, or else from `url`; None if there is none.
+    """
+    try:
+        if DOCUMENTS_TABLE not in get_db().table_names():
+            return None
+        names = get_db().open_table(DOCUMENTS_TABLE).schema.names
+        for column, value in (("content_hash", content_hash), ("url", url)):
+            if value is None or column not in names:
+                continue
+            document = _find_document(f"{column} = {quote(value)}")
+            if document is not None:
+                return document
+        return None
+
+    except Exception as e:
+        raise DocumentStoreException(f"Failed to look up document: {str(e)}")
+
+
+def _find_document(where: str) -> Optional[Dict[str, Any]]:
+    if DOCUMENTS_TABLE not in get_db().table_names():
+        return None
+    rows = get_db().open_table(DOCUMENTS_TABLE).search().where(where).limit(1).to_arrow().to_pylist()
+    if not rows:
+        return None
+    document = rows[0]
+    document['metadata'] = json.loads(document['metadata'] or '{}')
+    return document
+
+
+def add_document_fingerprints() -> bool:
+    """
+    Add the `content_hash` and `url` columns to a `documents` table created
+    before they existed. Documents registered earlier keep nulls there, so
+    their files are ingested once more before duplicates are recognized.
+
+    Returns:
+        bool: True if columns were added
+    """
+    if DOCUMENTS_TABLE not in get_db().table_names():
+        return False
+    table = get_db().open_table(DOCUMENTS_TABLE)
+    missing = [field for field in FINGERPRINT_FIELDS if field.name not in table.schema.names]
+    if not missing:
+        return False
+    table.add_columns(missing)
+    LOG.info("Added %s column(s) to %s", [field.name for field in missing], DOCUMENTS_TABLE)
+    return True
+
+
+async def aget_document(document_id: str) -> Optional[Dict[str, Any]]:
+    """Async `get_document`, for request handlers."""
+    try:
+        async_db = await get_async_db()
+        try:
+            table = await async_db.open_table(DOCUMENTS_TABLE)
+        except ValueError:
+            return None
+        rows = await table.query().where(document_filter(document_id)).limit(1).to_list()
+        if not rows:
+            return None
+        document = rows[0]
+        document['metadata'] = json.loads(document['metadata'] or '{}')
+        return document
+
+    except Exception as e:
+        raise DocumentStoreException(f"Failed to look up document: {str(e)}")
+
+
+def delete_document(document_id: str) -> bool:
+    """
+    Remove a document's chunks, graph and metadata row.
+
+    Returns:
+        bool: False if the document was not registered
+    """
+    try:
+        if get_document(document_id) is None:
+            return False
+
+        if EMBEDDINGS_TABLE in get_db().table_names():
+            get_db().open_table(EMBEDDINGS_TABLE).delete(document_filter(document_id))
+        delete_graph(document_id)
+        delete_communities(document_id)
+        # Metadata goes last so a half-finished delete can simply be retried.
+        get_db().open_table(DOCUMENTS_TABLE).delete(document_filter(document_id))
+        LOG.info("Deleted document %s", document_id)
+        return True
+
+    except Exception as e:
+        raise DocumentStoreException(f"Failed to delete document: {str(e)}")
@@ -1,56 +1,217 @@
+import asyncio
 import logging
-from typing import List
-from tqdm import tqdm
-from app.utils.config import db
-from app.utils.embedding_utils import get_embedding
+from typing import Dict, List
+from app.services.index_manager import document_filter, ensure_indexes
+from app.utils.config import Config
+from app.utils.resources import get_db
+from app.utils.embedding_utils import aget_embeddings
+from app.utils.metrics import CHUNKS_REUSED
+from app.utils.text_splitter import chunk_hash
 import pyarrow as pa
 import numpy as np
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_embeddings(document_id: str, chunks: List[str], knowledge_graph):
-    """Create and store embeddings in LanceDB"""
+EMBEDDINGS_TABLE = 'embeddings'
+
+# Compact vector representations (VECTOR_COMPACT) and the columns holding them.
+COMPACT_COLUMNS = {"float16": "vector_f16", "int8": "vector_i8"}
+# Per-row dequantization scale of the int8 codes.
+SCALE_COLUMN = "vector_scale"
+
+
+def vectors_to_arrow(matrix: np.ndarray, dtype=np.float32) -> pa.FixedSizeListArray:
+    """Wrap a (n, dim) matrix as an Arrow FixedSizeList column without per-row copies."""
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    values = pa.array(matrix.reshape(-1), type=pa.from_numpy_dtype(matrix.dtype))
+    return pa.FixedSizeListArray.from_arrays(values, matrix.shape[1])
+
+
+def arrow_to_vectors(column) -> np.ndarray:
+    """Inverse of `vectors_to_arrow`: a (n, dim) matrix view of a FixedSizeList column."""
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    return column.flatten().to_numpy(zero_copy_only=False).reshape(len(column), -1)
+
+
+def compact_fields(kind: str, dimension: int) -> List[pa.Field]:
+    if kind == "float16":
+        return [pa.field(COMPACT_COLUMNS[kind], pa.list_(pa.float16(), dimension))]
+    return [pa.field(COMPACT_COLUMNS[kind], pa.list_(pa.int8(), dimension)), pa.field(SCALE_COLUMN, pa.float32())]
+
+
+def compact_vectors(matrix: np.ndarray, kind: str) -> Dict[str, pa.Array]:
+    """
+    Compact columns for the rows of `matrix`.
+
+    Rows are normalized first, so both representations score by cosine with a
+    plain dot product. int8 codes are symmetric per row: code * scale
+    approximates the unit vector.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    unit = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    if kind == "float16":
+        return {COMPACT_COLUMNS[kind]: vectors_to_arrow(unit, np.float16)}
+
+    scales = np.abs(unit).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.rint(unit / scales[:, None]).astype(np.int8)
+    return {COMPACT_COLUMNS[kind]: vectors_to_arrow(codes, np.int8), SCALE_COLUMN: pa.array(scales, type=pa.float32())}
+
+
+def compact_kinds(schema: pa.Schema) -> List[str]:
+    """Compact representations a table holds."""
+    return [kind for kind, column in COMPACT_COLUMNS.items() if column in schema.names]
+
+
+def _upsert_document_rows(document_id: str, data: pa.Table):
+    """Replace a document's rows in the embeddings table, leaving other documents untouched."""
+    db = get_db()
+    if EMBEDDINGS_TABLE in db.table_names():
+        table = db.open_table(EMBEDDINGS_TABLE)
+        if "knowledge_graph" in table.schema.names or "chunk_index" not in table.schema.names:
+            raise RuntimeError(f"Table {EMBEDDINGS_TABLE} has the layout of an older version; "
+                               "run `python -m app.services.migrations` before uploading")
+        # Write exactly the compact columns the table has, whatever VECTOR_COMPACT says.
+        missing = set(data.schema.names) - set(table.schema.names)
+        if missing:
+            logger.warning("Table %s has no %s column(s); run `python -m app.services.migrations` to add them",
+                           EMBEDDINGS_TABLE, sorted(missing))
+            data = data.drop_columns(sorted(missing))
+        for kind in compact_kinds(table.schema):
+            if COMPACT_COLUMNS[kind] not in data.schema.names:
+                for name, column in compact_vectors(arrow_to_vectors(data.column("vector")), kind).items():
+                    data = data.append_column(table.schema.field(name), column)
+        data = data.select(table.schema.names)
+    else:
+        table = db.create_table(EMBEDDINGS_TABLE, schema=data.schema)
+
+    table.merge_insert("id") \
+        .when_matched_update_all() \
+        .when_not_matched_insert_all() \
+        .when_not_matched_by_source_delete(document_filter(document_id)) \
+        .execute(data)
+
+    ensure_indexes(table, ["id", "document_id"])
+    return table
+
+
+def add_compact_vectors(kind: str = None, table_name: str = EMBEDDINGS_TABLE) -> int:
+    """
+    Add the `kind` (VECTOR_COMPACT by default) compact vector column(s) to an
+    existing table and fill them in, one document at a time.
+
+    Returns:
+        int: Number of documents filled in
+    """
+    kind = kind or Config.VECTOR_COMPACT
+    if kind not in COMPACT_COLUMNS or table_name not in get_db().table_names():
+        return 0
+
+    table = get_db().open_table(table_name)
+    if COMPACT_COLUMNS[kind] in table.schema.names:
+        logger.info("Table %s already has %s vectors", table_name, kind)
+        return 0
+
+    dimension = table.schema.field("vector").type.list_size
+    table.add_columns(compact_fields(kind, dimension))
+
+    document_ids = set(table.search().select(["document_id"]).limit(None).to_arrow().column("document_id").to_pylist())
+    for document_id in document_ids:
+        rows = table.search().where(document_filter(document_id)).select(["id", "vector"]).limit(None).to_arrow()
+        update = pa.table({"id": rows.column("id"), **compact_vectors(arrow_to_vectors(rows.column("vector")), kind)})
+        table.merge_insert("id").when_matched_update_all().execute(update)
+
+    logger.info("Added %s vectors for %d documents to %s", kind, len(document_ids), table_name)
+    return len(document_ids)
+
+
+def load_chunk_vectors(document_id: str) -> Dict[str, np.ndarray]:
+    """A stored document's chunk vectors, keyed by `chunk_hash` of the chunk text."""
+    if EMBEDDINGS_TABLE not in get_db().table_names():
+        return {}
+    rows = get_db().open_table(EMBEDDINGS_TABLE).search().where(
+        document_filter(document_id)
+    ).select(["text", "vector"]).limit(None).to_arrow()
+    if not rows.num_rows:
+        return {}
+    vectors = arrow_to_vectors(rows.column("vector"))
+    return {chunk_hash(text): vector for text, vector in zip(rows.column("text").to_pylist(), vectors)}
+
+
+async def _embed_chunks(chunks: List[str], known: Dict[str, np.ndarray]) -> np.ndarray:
+    """Embed the chunks whose hash is not in `known` and take the others' vectors from it."""
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    missing = [i for i, key in enumerate(hashes) if key not in known]
+    if len(missing) == len(chunks):
+        return await aget_embeddings(chunks)
+
+    rows = [known.get(key) for key in hashes]
+    if missing:
+        fresh = await aget_embeddings([chunks[i] for i in missing])
+        reused = next(vector for vector in rows if vector is not None)
+        if fresh.shape[1] != len(reused):
+            # Stored with another embedding model; nothing can be reused.
+            return await aget_embeddings(chunks)
+        for i, vector in zip(missing, fresh):
+            rows[i] = vector
+    CHUNKS_REUSED.inc(len(chunks) - len(missing), stage="embed")
+    logger.info("Reused the vectors of %d of %d chunks", len(chunks) - len(missing), len(chunks))
+    return np.vstack(rows).astype(np.float32)
+
+
+async def embed_document(document_id: str, chunks: List[str], known: Dict[str, np.ndarray] = None) -> pa.Table:
+    """
+    Embed a document's chunks into rows of the embeddings table, without storing them.
+
+    `known` maps `chunk_hash` of chunk texts to vectors embedded before (see
+    `load_chunk_vectors`); those chunks are not sent to the embeddings API.
+    """
     if not chunks:
         logging.error("Chunks list is empty")
         raise ValueError("Chunks list is empty")
 
+    matrix = await _embed_chunks(chunks, known or {})
+    logger.info("Embedded %d chunks into a %s matrix", len(chunks), matrix.shape)
+
+    vector_dimension = matrix.shape[1]
+    schema = pa.schema([
+        pa.field("id", pa.string()),
+        pa.field("document_id", pa.string()),
+        pa.field("chunk_index", pa.int32()),
+        pa.field("text", pa.string()),
+        pa.field("vector", pa.list_(pa.float32(), vector_dimension))
+    ])
+
+    data = pa.Table.from_arrays([
+        pa.array([f'{document_id}_{idx}' for idx in range(len(chunks))], type=pa.string()),
+        pa.array([document_id] * len(chunks), type=pa.string()),
+        pa.array(range(len(chunks)), type=pa.int32()),
+        pa.array(chunks, type=pa.string()),
+        vectors_to_arrow(matrix)
+    ], schema=schema)
+
+    if Config.VECTOR_COMPACT in COMPACT_COLUMNS:
+        for field, column in zip(compact_fields(Config.VECTOR_COMPACT, vector_dimension),
+                                 compact_vectors(matrix, Config.VECTOR_COMPACT).values()):
+            data = data.append_column(field, column)
+    return data
+
+
+def store_embeddings(document_id: str, data: pa.Table):
+    """Replace a document's stored chunks with the rows made by `embed_document`."""
+    table = _upsert_document_rows(document_id, data)
+    logger.info(f"Successfully stored {data.num_rows} embeddings for document {document_id} in {table.name}")
+
+
+async def create_embeddings(document_id: str, chunks: List[str], known: Dict[str, np.ndarray] = None):
+    """Create and store embeddings in LanceDB (`embed_document` then `store_embeddings`)"""
     try:
-        embeddings = []
-        for idx, chunk in enumerate(tqdm(chunks, desc="Creating embeddings")):
-            embedding = get_embedding(chunk)
-            embedding_array = np.array(embedding, dtype=np.float32)
-
-            embeddings.append({
-                'id': f'{document_id}_{idx}',
-                'document_id': document_id,
-                'text': chunk,
-                'vector': embedding_array.tolist(),
-                'knowledge_graph': knowledge_graph
-            })
-
-        vector_dimension = len(embeddings[0]['vector'])
-        schema = pa.schema([
-            pa.field("id", pa.string()),
-            pa.field("document_id", pa.string()),
-            pa.field("text", pa.string()),
-            pa.field("vector", pa.list_(pa.float32(), vector_dimension)),
-            pa.field("knowledge_graph", pa.string())
-        ])
-
-        table_name = 'embeddings'
-        table = db.create_table(
-            table_name,
-            schema=schema,
-            mode="overwrite"
-        )
-
-        # Add embeddings
-        table.add(embeddings)
-
-        logger.info(f"Successfully created embeddings table with schema: {table.schema}")
+        data = await embed_document(document_id, chunks, known)
+        await asyncio.to_thread(store_embeddings, document_id, data)
         return True
 
     except Exception as e:
         logger.error(f"Error in create_embeddings: {str(e)}")
-        raise
\ No newline at end of file
+        raise
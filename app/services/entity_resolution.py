@@ -0,0 +1,141 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Rows of the similarity matrix computed per block, to bound peak memory.
+_BLOCK_SIZE = 1024
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_ARTICLE = re.compile(r"^(the|a|an) ")
+
+
+def normalize_entity_name(name: str) -> str:
+    """Lower-cased, accent-preserving, punctuation-free form used to match entity names."""
+    name = unicodedata.normalize("NFKC", name).casefold()
+    name = _WHITESPACE.sub(" ", _NON_WORD.sub(" ", name)).strip()
+    return _ARTICLE.sub("", name)
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = np.arange(size)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # The lower index (earlier chunk) stays the root so merges are deterministic.
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def _union_similar(groups: Dict[str, List[int]], vectors: np.ndarray, threshold: float, sets: _UnionFind):
+    """Union nodes of the same type whose name embeddings have cosine similarity >= threshold."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members = np.asarray(members)
+        group = vectors[members]
+        for start in range(0, len(members), _BLOCK_SIZE):
+            block = group[start:start + _BLOCK_SIZE] @ group.T
+            rows, cols = np.nonzero(block >= threshold)
+            rows += start
+            upper = rows < cols
+            for a, b in zip(members[rows[upper]], members[cols[upper]]):
+                sets.union(int(a), int(b))
+
+
+def resolve_entities(graph: Dict[str, Any], name_vectors: Optional[np.ndarray] = None,
+                     similarity_threshold: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Merge nodes that refer to the same entity across chunks.
+
+    Nodes are merged when their normalized name and type match and, if
+    `name_vectors` (row-aligned with graph['nodes']) and `similarity_threshold`
+    are given, when their name embeddings are at least that similar within the
+    same type. Each merged node keeps the id of its earliest member, the most
+    common surface name and the union of chunk indices. Edges are rewritten to
+    the surviving ids; parallel edges collapse into one whose `weight` is the
+    sum of theirs, and self-loops introduced by merging are dropped.
+
+    Returns:
+        Dict[str, Any]: A new graph with the same structure
+    """
+    nodes = graph.get('nodes', [])
+    if not nodes:
+        return graph
+
+    sets = _UnionFind(len(nodes))
+    first_by_key = {}
+    by_type = {}
+    for i, node in enumerate(nodes):
+        node_type = normalize_entity_name(node['type'])
+        key = (node_type, normalize_entity_name(node['name']))
+        if key in first_by_key:
+            sets.union(first_by_key[key], i)
+        else:
+            first_by_key[key] = i
+            # Only one representative per exact key needs the vector comparison.
+            by_type.setdefault(node_type, []).append(i)
+
+    if name_vectors is not None and similarity_threshold:
+        _union_similar(by_type, np.asarray(name_vectors, dtype=np.float32), similarity_threshold, sets)
+
+    members = {}
+    for i in range(len(nodes)):
+        members.setdefault(sets.find(i), []).append(i)
+
+    canonical_id = {}
+    merged_nodes = []
+    for root in sorted(members):
+        group = [nodes[i] for i in members[root]]
+        names = Counter(node['name'] for node in group)
+        chunk_indices = sorted({
+            index
+            for node in group
+            for index in node.get('chunk_indices', [node.get('chunk_index')])
+            if index is not None
+        })
+        merged = {
+            'id': nodes[root]['id'],
+            # most_common keeps first-seen order among ties
+            'name': names.most_common(1)[0][0],
+            'type': nodes[root]['type'],
+            'chunk_index': chunk_indices[0] if chunk_indices else None,
+            'chunk_indices': chunk_indices
+        }
+        merged_nodes.append(merged)
+        for node in group:
+            canonical_id[node['id']] = merged['id']
+
+    edge_weights = {}
+    for edge in graph.get('edges', []):
+        source = canonical_id.get(edge['source'], edge['source'])
+        target = canonical_id.get(edge['target'], edge['target'])
+        if source == target and edge['source'] != edge['target']:
+            continue
+        key = (source, target, edge['type'])
+        edge_weights[key] = edge_weights.get(key, 0.0) + edge.get('weight', 1.0)
+
+    merged_edges = [
+        {'source': source, 'target': target, 'type': edge_type, 'weight': weight}
+        for (source, target, edge_type), weight in edge_weights.items()
+    ]
+
+    metadata = dict(graph.get('metadata', {}))
+    metadata['unresolved_nodes'] = len(nodes)
+    metadata['unresolved_edges'] = len(graph.get('edges', []))
+
+    return {'nodes': merged_nodes, 'edges': merged_edges, 'metadata': metadata}
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.graph_store import graph_cache, graph_from_entry, load_graph_entry
+from app.utils.config import Config
+from app.utils.embedding_utils import aget_embeddings
+
+LOG = logging.getLogger(__name__)
+
+
+class GraphIndex:
+    """
+    Read-only, array-backed view of a knowledge graph for query-time retrieval.
+
+    Adjacency is stored in CSR form (`indptr`, `neighbors`) with both edge
+    directions present, so a node's neighbours are a contiguous slice.
+    `name_vectors` holds the L2-normalized embedding of every entity name, row
+    aligned with `nodes`.
+    """
+
+    def __init__(self, nodes: List[Dict[str, Any]], indptr: np.ndarray, neighbors: np.ndarray,
+                 edge_weights: np.ndarray, edge_types: np.ndarray, edge_forward: np.ndarray,
+                 name_vectors: np.ndarray):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.edge_weights = edge_weights
+        self.edge_types = edge_types
+        self.edge_forward = edge_forward
+        self.name_vectors = name_vectors
+
+    @classmethod
+    def build(cls, graph: Dict[str, Any], name_vectors: np.ndarray) -> "GraphIndex":
+        nodes = graph.get('nodes', [])
+        position = {node['id']: i for i, node in enumerate(nodes)}
+
+        sources, targets, weights, types = [], [], [], []
+        for edge in graph.get('edges', []):
+            source = position.get(edge['source'])
+            target = position.get(edge['target'])
+            if source is None or target is None:
+                continue
+            sources.append(source)
+            targets.append(target)
+            weights.append(edge.get('weight', 1.0))
+            types.append(edge['type'])
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        # Store every edge in both directions; `forward` remembers which one is original.
+        heads = np.concatenate([sources, targets])
+        tails = np.concatenate([targets, sources])
+        forward = np.concatenate([np.ones(len(sources), dtype=bool), np.zeros(len(sources), dtype=bool)])
+        edge_ids = np.concatenate([np.arange(len(sources)), np.arange(len(sources))])
+
+        order = np.argsort(heads, kind='stable')
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=len(nodes)), out=indptr[1:])
+
+        weights = np.asarray(weights, dtype=np.float32)
+        # Log-damp weights so a relation repeated many times does not dominate.
+        weights = 1.0 + np.log(np.maximum(weights, 1.0)) if len(weights) else weights
+
+        vectors = np.asarray(name_vectors, dtype=np.float32).reshape(len(nodes), -1) if nodes \
+            else np.empty((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        return cls(
+            nodes=nodes,
+            indptr=indptr,
+            neighbors=tails[order],
+            edge_weights=weights[edge_ids[order]] if len(weights) else weights,
+            edge_types=np.asarray(types, dtype=object)[edge_ids[order]] if types else np.empty(0, dtype=object),
+            edge_forward=forward[order],
+            name_vectors=vectors
+        )
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _expand(self, seed: int, seed_score: float, hops: int, decay: float):
+        """Best-first k-hop expansion from one seed; returns per-node scores and parent links."""
+        scores = np.zeros(len(self.nodes), dtype=np.float32)
+        parent_edge = np.full(len(self.nodes), -1, dtype=np.int64)
+        scores[seed] = seed_score
+        frontier = np.array([seed], dtype=np.int64)
+
+        for _ in range(hops):
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            if counts.sum() == 0:
+                break
+            # Flat positions of every CSR entry adjacent to the frontier.
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            candidates = self.neighbors[offsets]
+            candidate_scores = np.repeat(scores[frontier], counts) * decay
+            candidate_scores *= self.edge_weights[offsets] / self.edge_weights.max()
+
+            improved = candidate_scores > scores[candidates]
+            if not improved.any():
+                break
+            # Keep the best incoming edge per candidate node.
+            best = np.lexsort((-candidate_scores[improved], candidates[improved]))
+            cand = candidates[improved][best]
+            first = np.ones(len(cand), dtype=bool)
+            first[1:] = cand[1:] != cand[:-1]
+            chosen = offsets[improved][best][first]
+            cand = cand[first]
+            scores[cand] = candidate_scores[improved][best][first]
+            parent_edge[cand] = chosen
+            frontier = cand
+
+        return scores, parent_edge
+
+    def _edge_head(self, offset: int) -> int:
+        return int(np.searchsorted(self.indptr, offset, side='right') - 1)
+
+    def describe_edge(self, offset: int) -> str:
+        """The CSR entry at `offset` as 'head type tail', in the edge's original direction."""
+        head = self.nodes[self._edge_head(offset)]['name']
+        tail = self.nodes[int(self.neighbors[offset])]['name']
+        if not self.edge_forward[offset]:
+            head, tail = tail, head
+        return f"{head} {self.edge_types[offset]} {tail}"
+
+    def query(self, query_vector: np.ndarray, top_k: int = None, hops: int = None,
+              max_nodes: int = None, decay: float = None) -> List[Dict[str, Any]]:
+        """
+        Find the entities most similar to the query and expand `hops` hops around them.
+
+        Returns:
+            List[Dict[str, Any]]: One result per seed entity, each with the
+            `nodes`, `explanation` and `confidence` keys expected by
+            answer_service.format_graph_results
+        """
+        if not self.nodes:
+            return []
+        top_k = top_k or Config.GRAPH_QUERY_SEEDS
+        hops = Config.GRAPH_QUERY_HOPS if hops is None else hops
+        max_nodes = max_nodes or Config.GRAPH_QUERY_MAX_NODES
+        decay = decay or Config.GRAPH_QUERY_DECAY
+
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        similarity = self.name_vectors @ query_vector
+
+        top_k = min(top_k, len(self.nodes))
+        seeds = np.argpartition(-similarity, top_k - 1)[:top_k]
+        seeds = seeds[np.argsort(-similarity[seeds], kind='stable')]
+
+        results = []
+        for seed in seeds:
+            seed_score = float(similarity[seed])
+            if seed_score < Config.GRAPH_QUERY_MIN_SIMILARITY:
+                continue
+            scores, parent_edge = self._expand(int(seed), seed_score, hops, decay)
+
+            reached = np.flatnonzero(scores > 0)
+            reached = reached[np.argsort(-scores[reached], kind='stable')][:max_nodes]
+            relations = [self.describe_edge(int(parent_edge[i])) for i in reached if parent_edge[i] >= 0]
+
+            explanation = f"'{self.nodes[seed]['name']}' matches the question"
+            if relations:
+                explanation += "; related facts: " + "; ".join(relations)
+            results.append({
+                'nodes': [self.nodes[i] for i in reached],
+                'explanation': explanation,
+                'confidence': max(0.0, min(1.0, seed_score))
+            })
+
+        return results
+
+
+async def build_graph_index(graph: Dict[str, Any]) -> GraphIndex:
+    """Embed the entity names of `graph` (through the embedding cache) and index it."""
+    names = [node['name'] for node in graph.get('nodes', [])]
+    vectors = await aget_embeddings(names) if names else np.empty((0, 0), dtype=np.float32)
+    return GraphIndex.build(graph, vectors)
+
+
+async def load_graph_index(document_id: str, version: Optional[str] = None) -> Optional[GraphIndex]:
+    """Return the GraphIndex for a document's full graph, cached alongside its parsed tables."""
+    entry = graph_cache.get(document_id, version)
+    if entry is None:
+        # Cold load reads the nodes/edges tables; keep it off the event loop.
+        entry = await asyncio.to_thread(load_graph_entry, document_id, version)
+    if entry is None:
+        return None
+    if 'index' not in entry:
+        # Built from the entry itself: looking the graph up again would count a second lookup.
+        graph = await asyncio.to_thread(graph_from_entry, document_id, entry)
+        entry['index'] = await build_graph_index(graph)
+    return entry['index']
@@ -1,26 +1,69 @@
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import List, Dict, Any, Callable, Optional
 from datetime import datetime
+import asyncio
+import logging
 import os
+import random
 from collections import defaultdict
 import json
 
+import numpy as np
+
+from app.services.entity_resolution import resolve_entities
+from app.services.graph_index import GraphIndex, build_graph_index
+from app.services.graph_store import get_extractions, save_extractions
+from app.utils.config import Config
+from app.utils.embedding_utils import aget_embeddings
+from app.utils.metrics import CHUNKS_REUSED, llm_call, record_llm_usage
+from app.utils.openai_scheduler import chat_scheduler, estimate_chat_tokens, request_key, usage_tokens
+from app.utils.text_splitter import chunk_hash
+
+LOG = logging.getLogger(__name__)
+
+# Malformed model output is worth asking for again. Rate limits and flaky
+# upstream calls are already retried by the OpenAI scheduler.
+TRANSIENT_ERRORS = (
+    json.JSONDecodeError,
+    KeyError,
+    TypeError,
+)
+
+# Part of the chunk extraction cache key; bump it when the extraction prompt changes.
+EXTRACTION_PROMPT_VERSION = 1
+
 
 class GraphServiceException(Exception):
     """Custom exception for graph service errors"""
     pass
 
 
+def _check_extraction(result: Dict[str, Any]):
+    """Raise KeyError if an extraction payload lacks fields the merge relies on."""
+    for entity in result['entities']:
+        missing = {'id', 'name', 'type'} - entity.keys()
+        if missing:
+            raise KeyError(f"entity missing {sorted(missing)}")
+    for rel in result['relationships']:
+        missing = {'source', 'target', 'type'} - rel.keys()
+        if missing:
+            raise KeyError(f"relationship missing {sorted(missing)}")
+
+
 class CustomGraphService:
     def __init__(self, api_key: str = None):
         """Initialize the service with OpenAI API key"""
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if not self.api_key:
             raise GraphServiceException("OpenAI API key is required")
+        from langchain_openai import ChatOpenAI
+
         self.llm = ChatOpenAI(
             openai_api_key=self.api_key,
+            openai_api_base=Config.OPENAI_BASE_URL,
             model_name="gpt-3.5-turbo",
-            temperature=0
+            temperature=0,
+            # Retries are made by the scheduler, which needs to see the 429s.
+            max_retries=0
         )
 
     async def _extract_entities_and_relations(self, text: str) -> Dict[str, Any]:
@@ -52,19 +95,59 @@ class CustomGraphService:
                 {"role": "user", "content": prompt}
             ]
 
-            response = await self.llm.ainvoke(messages)
-            return json.loads(response.content)
+            async def request():
+                with llm_call("extract"):
+                    response = await self.llm.ainvoke(messages)
+                record_llm_usage("extract", response)
+                return response
+
+            response = await chat_scheduler.call(request, estimate_chat_tokens(messages),
+                                                 key=request_key("extract", messages), usage=usage_tokens)
+            result = json.loads(response.content)
+            _check_extraction(result)
+            return result
 
         except Exception as e:
-            raise GraphServiceException(f"Failed to extract entities and relations: {str(e)}")
+            raise GraphServiceException(f"Failed to extract entities and relations: {str(e)}") from e
+
+    def extraction_key(self, text: str) -> str:
+        """Cache key of a chunk's extraction: the same text, model and prompt give the same result."""
+        return request_key("extract", self.llm.model_name, EXTRACTION_PROMPT_VERSION, chunk_hash(text))
 
-    async def create_knowledge_graph(self, document_id: str, chunks: List[str]) -> Dict[str, Any]:
+    async def _extract_with_retry(self, index: int, text: str,
+                                  semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+        """Extract one chunk under `semaphore`, retrying transient failures with backoff.
+
+        Returns None once retries are exhausted or the failure is not transient.
+        """
+        attempts = Config.GRAPH_EXTRACTION_MAX_RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                async with semaphore:
+                    return await self._extract_entities_and_relations(text)
+            except GraphServiceException as e:
+                transient = isinstance(e.__cause__, TRANSIENT_ERRORS)
+                if not transient or attempt == attempts:
+                    LOG.warning("Giving up on chunk %d after %d attempt(s): %s", index, attempt, str(e))
+                    return None
+                delay = Config.GRAPH_EXTRACTION_BACKOFF_SECONDS * 2 ** (attempt - 1)
+                delay *= 1 + random.random() * 0.25
+                LOG.info("Retrying chunk %d in %.1fs (attempt %d): %s", index, delay, attempt, str(e))
+                await asyncio.sleep(delay)
+
+    async def create_knowledge_graph(self, document_id: str, chunks: List[str],
+                                     on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
         """
         Create a knowledge graph from document chunks.
 
+        Chunks extracted before (by any upload, with EXTRACTION_CACHE_ENABLED)
+        reuse the stored extraction; only the others are sent to the LLM.
+
         Args:
             document_id (str): Unique identifier for the document
             chunks (List[str]): List of text chunks from the document
+            on_progress (Callable[[int, int], None], optional): Called with
+                (chunks done, total chunks) as each chunk finishes
 
         Returns:
             Dict[str, Any]: Knowledge graph data structure
@@ -73,9 +156,39 @@ class CustomGraphService:
             all_entities = {}
             all_relationships = []
 
-            # Process each chunk
-            for i, chunk in enumerate(chunks):
-                result = await self._extract_entities_and_relations(chunk)
+            keys = [self.extraction_key(chunk) for chunk in chunks]
+            cached = await asyncio.to_thread(get_extractions, keys) if Config.EXTRACTION_CACHE_ENABLED else {}
+            semaphore = asyncio.Semaphore(Config.GRAPH_EXTRACTION_CONCURRENCY)
+            done = 0
+
+            async def extract(i: int, chunk: str) -> Optional[Dict[str, Any]]:
+                nonlocal done
+                result = cached.get(keys[i])
+                if result is None:
+                    result = await self._extract_with_retry(i, chunk, semaphore)
+                done += 1
+                if on_progress:
+                    on_progress(done, len(chunks))
+                return result
+
+            results = await asyncio.gather(*(extract(i, chunk) for i, chunk in enumerate(chunks)))
+
+            reused = sum(1 for key in keys if key in cached)
+            if reused:
+                CHUNKS_REUSED.inc(reused, stage="graph")
+                LOG.info("Reused the extractions of %d of %d chunks", reused, len(chunks))
+            if Config.EXTRACTION_CACHE_ENABLED:
+                fresh = {key: result for key, result in zip(keys, results) if result is not None and key not in cached}
+                await asyncio.to_thread(save_extractions, fresh)
+
+            failed_chunks = [i for i, result in enumerate(results) if result is None]
+            if chunks and len(failed_chunks) == len(chunks):
+                raise GraphServiceException("Entity extraction failed for every chunk")
+
+            # Merge in chunk order so the graph does not depend on completion order
+            for i, result in enumerate(results):
+                if result is None:
+                    continue
 
                 for entity in result['entities']:
                     new_id = f"{i}_{entity['id']}"
@@ -100,65 +213,51 @@ class CustomGraphService:
                 'metadata': {
                     'document_id': document_id,
                     'num_chunks': len(chunks),
+                    'failed_chunks': failed_chunks,
                     'created_at': datetime.now().isoformat()
                 }
             }
 
-            return graph
+            return await self._resolve_entities(graph)
 
+        except GraphServiceException:
+            raise
         except Exception as e:
             raise GraphServiceException(f"Failed to create knowledge graph: {str(e)}")
 
+    async def _resolve_entities(self, graph: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge per-chunk duplicates of the same entity into single nodes."""
+        threshold = Config.ENTITY_RESOLUTION_SIMILARITY
+        name_vectors = None
+        if threshold and graph['nodes']:
+            name_vectors = await aget_embeddings([node['name'] for node in graph['nodes']])
+
+        resolved = resolve_entities(graph, name_vectors, threshold)
+        LOG.info("Entity resolution: %d -> %d nodes, %d -> %d edges",
+                 len(graph['nodes']), len(resolved['nodes']), len(graph['edges']), len(resolved['edges']))
+        return resolved
+
     async def query_knowledge_graph(
             self,
             graph: Dict[str, Any],
-            query: str
+            query: str,
+            query_vector: Optional[np.ndarray] = None,
+            index: Optional[GraphIndex] = None
     ) -> List[Dict[str, Any]]:
         """
         Query the knowledge graph.
+
+        Seed entities are found by embedding similarity to the query and
+        expanded over the graph locally; no LLM call is made. Pass a prebuilt
+        `index` and the query's embedding to skip rebuilding them.
         """
         try:
-            prompt = f"""
-            Given this knowledge graph:
-            Nodes: {json.dumps(graph['nodes'][:10])}
-            Edges: {json.dumps(graph['edges'][:10])}
-
-            Answer this query: {query}
-
-            Return the response in JSON format:
-            {{
-                "results": [
-                    {{
-                        "relevant_nodes": ["node_ids"],
-                        "explanation": "explanation of relevance",
-                        "confidence": 0.95
-                    }},
-                    ...
-                ]
-            }}
-            """
-
-            messages = [
-                {"role": "system", "content": "You are a knowledge graph query analyzer. Return only valid JSON."},
-                {"role": "user", "content": prompt}
-            ]
-
-            response = await self.llm.ainvoke(messages)
-            results = json.loads(response.content)
-
-            # Enhance results with actual node data
-            enhanced_results = []
-            nodes_dict = {node['id']: node for node in graph['nodes']}
-
-            for result in results['results']:
-                relevant_nodes = [nodes_dict[node_id] for node_id in result['relevant_nodes'] if node_id in nodes_dict]
-                enhanced_results.append({
-                    'nodes': relevant_nodes,
-                    'explanation': result['explanation'],
-                    'confidence': result['confidence']
-                })
+            if index is None:
+                index = await build_graph_index(graph)
+            if query_vector is None:
+                query_vector = (await aget_embeddings([query]))[0]
 
-            return enhanced_results
+            return index.query(query_vector)
 
         except Exception as e:
             raise GraphServiceException(f"Failed to query knowledge graph: {str(e)}")
@@ -0,0 +1,269 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+
+from app.services.index_manager import document_filter, ensure_scalar_indexes, quote
+from app.utils.config import Config
+from app.utils.metrics import register_collector
+from app.utils.resources import get_db
+
+LOG = logging.getLogger(__name__)
+
+NODES_TABLE = 'nodes'
+EDGES_TABLE = 'edges'
+EXTRACTIONS_TABLE = 'chunk_extractions'
+
+NODES_SCHEMA = pa.schema([
+    pa.field("document_id", pa.string()),
+    pa.field("id", pa.string()),
+    pa.field("name", pa.string()),
+    pa.field("type", pa.string()),
+    pa.field("chunk_indices", pa.list_(pa.int32()))
+])
+
+EDGES_SCHEMA = pa.schema([
+    pa.field("document_id", pa.string()),
+    pa.field("source", pa.string()),
+    pa.field("target", pa.string()),
+    pa.field("type", pa.string()),
+    pa.field("weight", pa.float32())
+])
+
+# Entities and relationships extracted from a chunk, keyed by the chunk's content and the extraction model.
+EXTRACTIONS_SCHEMA = pa.schema([
+    pa.field("key", pa.string()),
+    pa.field("extraction", pa.string())
+])
+
+# LanceDB filter strings get long quickly; look keys up in slices of this size.
+_LOOKUP_SLICE = 500
+
+
+class GraphStoreException(Exception):
+    """Custom exception for graph storage errors"""
+    pass
+
+
+class GraphCache:
+    """
+    Bounded LRU of parsed per-document graphs.
+
+    Entries are tagged with the document version they were loaded for; a lookup
+    with a different version is a miss, so re-uploads are picked up even when
+    they happened in another worker.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[Optional[str], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, document_id: str, version: Optional[str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(document_id)
+            return entry[1]
+
+    def put(self, document_id: str, version: Optional[str], value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[document_id] = (version, value)
+            self._entries.move_to_end(document_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document_id: str):
+        with self._lock:
+            self._entries.pop(document_id, None)
+
+
+graph_cache = GraphCache(Config.GRAPH_CACHE_SIZE)
+
+
+def _collect_metrics():
+    return [
+        ("graphrag_graph_cache_lookups_total", "counter", "Parsed graph cache lookups by result.", [
+            ({"result": "hit"}, graph_cache.hits),
+            ({"result": "miss"}, graph_cache.misses)
+        ])
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+def _replace_rows(table_name: str, schema: pa.Schema, document_id: str, data: pa.Table):
+    if table_name in get_db().table_names():
+        table = get_db().open_table(table_name)
+        table.delete(document_filter(document_id))
+    else:
+        table = get_db().create_table(table_name, schema=schema, exist_ok=True)
+    if data.num_rows:
+        table.add(data)
+    ensure_scalar_indexes(table, ["document_id"])
+
+
+def node_chunk_indices(node: Dict[str, Any]) -> List[int]:
+    """Chunks a graph node was extracted from, whether it has `chunk_indices` or a single `chunk_index`."""
+    if 'chunk_indices' in node:
+        return list(node['chunk_indices'])
+    if node.get('chunk_index') is not None:
+        return [node['chunk_index']]
+    return []
+
+
+def save_graph(document_id: str, graph: Dict[str, Any]):
+    """Store a document's graph as rows of the `nodes` and `edges` tables, replacing any previous version."""
+    try:
+        nodes = graph.get('nodes', [])
+        edges = graph.get('edges', [])
+
+        nodes_data = pa.table({
+            "document_id": pa.array([document_id] * len(nodes), type=pa.string()),
+            "id": pa.array([node['id'] for node in nodes], type=pa.string()),
+            "name": pa.array([node['name'] for node in nodes], type=pa.string()),
+            "type": pa.array([node['type'] for node in nodes], type=pa.string()),
+            "chunk_indices": pa.array([node_chunk_indices(node) for node in nodes], type=pa.list_(pa.int32()))
+        }, schema=NODES_SCHEMA)
+
+        edges_data = pa.table({
+            "document_id": pa.array([document_id] * len(edges), type=pa.string()),
+            "source": pa.array([edge['source'] for edge in edges], type=pa.string()),
+            "target": pa.array([edge['target'] for edge in edges], type=pa.string()),
+            "type": pa.array([edge['type'] for edge in edges], type=pa.string()),
+            "weight": pa.array([edge.get('weight', 1.0) for edge in edges], type=pa.float32())
+        }, schema=EDGES_SCHEMA)
+
+        _replace_rows(NODES_TABLE, NODES_SCHEMA, document_id, nodes_data)
+        _replace_rows(EDGES_TABLE, EDGES_SCHEMA, document_id, edges_data)
+        graph_cache.invalidate(document_id)
+
+        LOG.info("Stored graph for document %s: %d nodes, %d edges", document_id, len(nodes), len(edges))
+
+    except Exception as e:
+        raise GraphStoreException(f"Failed to save knowledge graph: {str(e)}")
+
+
+def _read_rows(table_name: str, document_id: str, columns: List[str]) -> Optional[pa.Table]:
+    if table_name not in get_db().table_names():
+        return None
+    table = get_db().open_table(table_name)
+    return table.search().where(document_filter(document_id)).select(columns).limit(None).to_arrow()
+
+
+def _nodes_from_arrow(rows: pa.Table) -> List[Dict[str, Any]]:
+    nodes = []
+    for row in rows.to_pylist():
+        chunk_indices = row.pop('chunk_indices') or []
+        row['chunk_index'] = min(chunk_indices) if chunk_indices else None
+        row['chunk_indices'] = chunk_indices
+        nodes.append(row)
+    return nodes
+
+
+def _graph(document_id: str, nodes: pa.Table, edges: pa.Table) -> Dict[str, Any]:
+    return {
+        'nodes': _nodes_from_arrow(nodes),
+        'edges': edges.to_pylist(),
+        'metadata': {'document_id': document_id}
+    }
+
+
+def get_cached_graph(document_id: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Return the cache entry for a document's graph, loading it on a miss.
+
+    The entry is a dict holding the `nodes` and `edges` Arrow tables; callers
+    may attach derived structures to it (see graph_index.load_graph_index) and
+    they are dropped together with the entry.
+    """
+    entry = graph_cache.get(document_id, version)
+    if entry is not None:
+        return entry
+    return load_graph_entry(document_id, version)
+
+
+def load_graph_entry(document_id: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Read a document's graph into a new cache entry, for callers that already looked it up and missed."""
+    nodes = _read_rows(NODES_TABLE, document_id, ["id", "name", "type", "chunk_indices"])
+    edges = _read_rows(EDGES_TABLE, document_id, ["source", "target", "type", "weight"])
+    if nodes is None or edges is None:
+        return None
+    entry = {'nodes': nodes.combine_chunks(), 'edges': edges.combine_chunks()}
+    graph_cache.put(document_id, version, entry)
+    return entry
+
+
+def graph_from_entry(document_id: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """A cache entry's graph in the dict shape produced by create_knowledge_graph."""
+    if entry is None:
+        return {}
+    return _graph(document_id, entry['nodes'], entry['edges'])
+
+
+def load_graph(document_id: str, version: Optional[str] = None) -> Dict[str, Any]:
+    """Load a document's full graph in the dict shape produced by create_knowledge_graph."""
+    try:
+        return graph_from_entry(document_id, get_cached_graph(document_id, version))
+
+    except Exception as e:
+        raise GraphStoreException(f"Failed to load knowledge graph: {str(e)}")
+
+
+def delete_graph(document_id: str):
+    """Remove a document's nodes and edges."""
+    try:
+        for table_name in (NODES_TABLE, EDGES_TABLE):
+            if table_name in get_db().table_names():
+                get_db().open_table(table_name).delete(document_filter(document_id))
+        graph_cache.invalidate(document_id)
+
+    except Exception as e:
+        raise GraphStoreException(f"Failed to delete knowledge graph: {str(e)}")
+
+
+def get_extractions(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Cached chunk extractions for `keys`; keys never stored are absent from the result."""
+    try:
+        if not keys or EXTRACTIONS_TABLE not in get_db().table_names():
+            return {}
+        table = get_db().open_table(EXTRACTIONS_TABLE)
+        unique = sorted(set(keys))
+        found = {}
+        for start in range(0, len(unique), _LOOKUP_SLICE):
+            in_list = ", ".join(quote(key) for key in unique[start:start + _LOOKUP_SLICE])
+            rows = table.search().where(f"key IN ({in_list})").select(["key", "extraction"]).limit(None).to_arrow()
+            for key, extraction in zip(rows.column("key").to_pylist(), rows.column("extraction").to_pylist()):
+                found[key] = json.loads(extraction)
+        return found
+
+    except Exception as e:
+        raise GraphStoreException(f"Failed to load chunk extractions: {str(e)}")
+
+
+def save_extractions(extractions: Dict[str, Dict[str, Any]]):
+    """Store chunk extractions by key; storing a key again replaces its extraction."""
+    try:
+        if not extractions:
+            return
+        data = pa.table({
+            "key": pa.array(list(extractions), type=pa.string()),
+            "extraction": pa.array([json.dumps(value) for value in extractions.values()], type=pa.string())
+        }, schema=EXTRACTIONS_SCHEMA)
+        table = get_db().create_table(EXTRACTIONS_TABLE, schema=EXTRACTIONS_SCHEMA, exist_ok=True)
+        table.merge_insert("key").when_matched_update_all().when_not_matched_insert_all().execute(data)
+        ensure_scalar_indexes(table, ["key"])
+
+    except Exception as e:
+        raise GraphStoreException(f"Failed to save chunk extractions: {str(e)}")
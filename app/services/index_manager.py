@@ -0,0 +1,109 @@
+import logging
+import math
+from typing import Iterable
+
+from app.utils.config import Config
+
+LOG = logging.getLogger(__name__)
+
+
+def quote(value: str) -> str:
+    """`value` as a string literal for a LanceDB filter; embedded quotes are doubled."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def document_filter(document_id: str) -> str:
+    """Filter selecting a document's rows. Ids come from clients, so they are always quoted."""
+    return f"document_id = {quote(document_id)}"
+
+
+def _indexed_columns(table) -> dict:
+    return {tuple(index.columns): index for index in table.list_indices()}
+
+
+def _is_stale(table, index) -> bool:
+    stats = table.index_stats(index.name)
+    return stats is not None and \
+        stats.num_unindexed_rows > stats.num_indexed_rows * Config.VECTOR_INDEX_REFRESH_FRACTION
+
+
+def _scalar_indexes_stale(table, columns: Iterable[str], existing: dict) -> bool:
+    """Build a BTREE index on each of `columns` that has none; True if an existing one needs refreshing."""
+    stale = False
+    for column in columns:
+        index = existing.get((column,))
+        if index is None:
+            LOG.info("Creating scalar index on %s.%s", table.name, column)
+            table.create_scalar_index(column, index_type="BTREE")
+        else:
+            stale = stale or _is_stale(table, index)
+    return stale
+
+
+def ensure_scalar_indexes(table, columns: Iterable[str]):
+    """Build a BTREE index on each of `columns` once the table is large enough to benefit."""
+    try:
+        if table.count_rows() < Config.SCALAR_INDEX_MIN_ROWS:
+            return
+        if _scalar_indexes_stale(table, columns, _indexed_columns(table)):
+            LOG.info("Refreshing scalar indexes on %s", table.name)
+            table.optimize()
+    except Exception as e:
+        # Indexes only speed things up; a failure must not fail the ingestion.
+        LOG.warning("Failed to ensure scalar indexes on %s: %s", table.name, str(e))
+
+
+def _create_vector_index(table, vector_column: str, num_rows: int):
+    dimension = table.schema.field(vector_column).type.list_size
+    LOG.info("Creating %s index on %s.%s over %d rows",
+             Config.VECTOR_INDEX_TYPE, table.name, vector_column, num_rows)
+    table.create_index(
+        metric="cosine",
+        vector_column_name=vector_column,
+        index_type=Config.VECTOR_INDEX_TYPE,
+        num_partitions=max(1, int(math.sqrt(num_rows))),
+        num_sub_vectors=max(1, dimension // 16),
+        replace=True
+    )
+
+
+def ensure_indexes(table, scalar_columns: Iterable[str], vector_column: str = "vector"):
+    """
+    `ensure_scalar_indexes` for a table that also has an ANN index on `vector_column`.
+
+    The ANN index is built once the table crosses VECTOR_INDEX_MIN_ROWS. New
+    rows are folded into the indexes with `optimize()` once they exceed
+    VECTOR_INDEX_REFRESH_FRACTION of the indexed rows. When the table has
+    grown VECTOR_INDEX_RETRAIN_GROWTH times past the rows the ANN index holds,
+    it is rebuilt instead, with partitions sized for the new row count.
+
+    `optimize()` folds new rows into every index of the table, after which
+    the ANN index no longer looks stale, so the rebuild is decided from the
+    index statistics before it runs, and it runs at most once.
+    """
+    try:
+        num_rows = table.count_rows()
+        existing = _indexed_columns(table)
+        stale = False
+        if num_rows >= Config.SCALAR_INDEX_MIN_ROWS:
+            stale = _scalar_indexes_stale(table, scalar_columns, existing)
+
+        index = existing.get((vector_column,))
+        if index is None:
+            if num_rows >= Config.VECTOR_INDEX_MIN_ROWS:
+                _create_vector_index(table, vector_column, num_rows)
+        elif _is_stale(table, index):
+            stats = table.index_stats(index.name)
+            if num_rows >= stats.num_indexed_rows * Config.VECTOR_INDEX_RETRAIN_GROWTH:
+                LOG.info("Retraining index %s on %s: %d rows indexed, %d in the table",
+                         index.name, table.name, stats.num_indexed_rows, num_rows)
+                _create_vector_index(table, vector_column, num_rows)
+            else:
+                stale = True
+
+        if stale:
+            LOG.info("Refreshing indexes on %s", table.name)
+            table.optimize()
+
+    except Exception as e:
+        LOG.warning("Failed to ensure indexes on %s: %s", table.name, str(e))
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.services.answer_cache import answer_cache
+from app.services.communities import CommunityException, build_communities
+from app.services.document_store import find_document, register_document
+from app.services.embeddings import embed_document, load_chunk_vectors, store_embeddings
+from app.services.graph_index import build_graph_index
+from app.services.graph_store import load_graph, save_graph
+from app.services.pdf_processor import ConverterPool, download_pdf
+from app.utils.config import Config
+from app.utils.metrics import CHUNKS, GRAPH_EDGES, GRAPH_NODES, INGESTION_JOBS, span, trace
+from app.utils.openai_scheduler import bulk_priority
+from app.utils.text_splitter import iter_chunks
+
+if TYPE_CHECKING:
+    from app.services.graph_service import CustomGraphService
+
+LOG = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class InMemoryJobStore:
+    """Job records kept in a dict; lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job['job_id']] = dict(job)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=datetime.now().isoformat())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore:
+    """Job records in a local SQLite file, visible to every worker on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, job: Dict[str, Any]):
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (job_id, data) VALUES (?, ?)", (job['job_id'], json.dumps(job)))
+
+    def update(self, job_id: str, **fields):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            job = json.loads(row[0])
+            job.update(fields, updated_at=datetime.now().isoformat())
+            conn.execute("UPDATE jobs SET data = ? WHERE job_id = ?", (json.dumps(job), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def create_job_store():
+    if Config.JOB_STORE_PATH:
+        return SQLiteJobStore(Config.JOB_STORE_PATH)
+    return InMemoryJobStore()
+
+
+class IngestionManager:
+    """
+    Runs /upload jobs in the background.
+
+    Each job streams the PDF to disk, converts it in a pool of pre-warmed
+    converter processes (docling is CPU-bound and must stay off the event
+    loop), splits it, then extracts the graph and embeds the chunks
+    concurrently before storing both. At most INGESTION_MAX_CONCURRENT_JOBS
+    jobs run at a time; the rest wait queued.
+
+    A file whose content hash matches an ingested document is not processed
+    again; the job completes with that document's id. A changed file from a
+    url ingested before replaces that document, and only its new or changed
+    chunks are extracted and embedded.
+    """
+
+    def __init__(self, graph_service: "CustomGraphService", store=None,
+                 max_concurrent_jobs: int = None, process_workers: int = None):
+        self.graph_service = graph_service
+        self.store = store or create_job_store()
+        self.max_concurrent_jobs = max_concurrent_jobs or Config.INGESTION_MAX_CONCURRENT_JOBS
+        self.converter_pool = ConverterPool(workers=process_workers)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    async def submit(self, url: str) -> Dict[str, Any]:
+        """Queue an ingestion job for `url` and return its record."""
+        now = datetime.now().isoformat()
+        job = {
+            'job_id': str(uuid.uuid4()),
+            'url': url,
+            'status': QUEUED,
+            'stage': None,
+            'progress': 0.0,
+            'document_id': None,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        await asyncio.to_thread(self.store.create, job)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        task = asyncio.create_task(self._run(job['job_id'], url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _update(self, job_id: str, **fields):
+        # The SQLite store blocks for up to its lock timeout; keep it off the event loop.
+        await asyncio.to_thread(self.store.update, job_id, **fields)
+
+    async def _report_progress(self, job_id: str, progress: List[float], finished: asyncio.Event):
+        """Write `progress[0]` when it changed, at most every JOB_PROGRESS_INTERVAL_SECONDS, until `finished`."""
+        written = progress[0]
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), Config.JOB_PROGRESS_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if progress[0] != written:
+                written = progress[0]
+                await self._update(job_id, progress=written)
+
+    async def _run(self, job_id: str, url: str):
+        async with self._semaphore:
+            pdf_path = None
+            try:
+                # Ingestion is bulk work: its OpenAI calls wait behind /answer traffic.
+                with trace(job_id), bulk_priority(), span("ingest"):
+                    await self._update(job_id, status=RUNNING, stage="download")
+                    with span("download"):
+                        pdf_path, document_id, content_hash = await asyncio.to_thread(download_pdf, url)
+                    previous = await asyncio.to_thread(find_document, content_hash, url)
+
+                    if previous is not None and previous.get('content_hash') == content_hash:
+                        document_id = previous['document_id']
+                        result = await self._duplicate(document_id)
+                    else:
+                        if previous is not None:
+                            # Same url, new content: update that document instead of adding another.
+                            document_id = previous['document_id']
+                        await self._update(job_id, document_id=document_id, stage="convert", progress=0.05)
+
+                        with span("convert"):
+                            elements = await self.converter_pool.convert(pdf_path)
+
+                        await self._update(job_id, stage="split", progress=0.3)
+                        with span("split"):
+                            chunks = await asyncio.to_thread(lambda: list(iter_chunks(elements)))
+                        if not chunks:
+                            raise HTTPException(status_code=400, detail="The document contains no text")
+                        CHUNKS.inc(len(chunks))
+
+                        result = await self._build(job_id, document_id, chunks, content_hash, url,
+                                                   update=previous is not None)
+                await self._update(job_id, status=COMPLETED, stage=None, progress=1.0,
+                                   document_id=document_id, result=result)
+                INGESTION_JOBS.inc(status=COMPLETED)
+                LOG.info("Ingestion job %s completed for document %s", job_id, document_id)
+
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                LOG.error("Ingestion job %s failed: %s", job_id, detail, exc_info=True)
+                await self._update(job_id, status=FAILED, error=detail)
+                INGESTION_JOBS.inc(status=FAILED)
+            finally:
+                if pdf_path and os.path.exists(pdf_path):
+                    os.remove(pdf_path)
+
+    async def _duplicate(self, document_id: str) -> Dict[str, Any]:
+        LOG.info("Document %s has the same content; skipping ingestion", document_id)
+        graph = await asyncio.to_thread(load_graph, document_id)
+        return {
+            "document_id": document_id,
+            "message": "PDF already processed; returning the existing document",
+            "graph_stats": self.graph_service.get_graph_statistics(graph) if graph else None,
+            "duplicate": True
+        }
+
+    async def _build(self, job_id: str, document_id: str, chunks: List[str], content_hash: str = None,
+                     url: str = None, update: bool = False) -> Dict[str, Any]:
+        # Chunks the previous version already had keep their vectors; extractions come from the cache.
+        known = await asyncio.to_thread(load_chunk_vectors, document_id) if update else None
+        await self._update(job_id, stage="graph+embed", progress=0.35)
+
+        # Called for every chunk; only the latest value is written, by _report_progress.
+        progress = [0.35]
+
+        def on_progress(done: int, total: int):
+            progress[0] = round(0.35 + 0.55 * done / total, 3)
+
+        async def timed(stage: str, work):
+            with span(stage):
+                return await work
+
+        finished = asyncio.Event()
+        reporter = asyncio.create_task(self._report_progress(job_id, progress, finished))
+        try:
+            # Graph extraction (LLM) and chunk embedding are independent; run them together.
+            # Nothing is stored until both succeed, so a failed job leaves no partial document.
+            knowledge_graph, embedding_rows = await asyncio.gather(
+                timed("graph", self.graph_service.create_knowledge_graph(document_id, chunks,
+                                                                         on_progress=on_progress)),
+                timed("embed", embed_document(document_id, chunks, known))
+            )
+        finally:
+            finished.set()
+            await reporter
+
+        await self._update(job_id, stage="store", progress=0.9)
+        stats = self.graph_service.get_graph_statistics(knowledge_graph)
+        LOG.info("Graph created successfully with stats: %s", stats)
+        with span("store"):
+            await asyncio.to_thread(store_embeddings, document_id, embedding_rows)
+            await asyncio.to_thread(save_graph, document_id, knowledge_graph)
+            # Embeds the entity names now, so the first /answer finds them in the embedding cache.
+            graph_index = await build_graph_index(knowledge_graph)
+
+        if Config.COMMUNITIES_ENABLED:
+            await self._update(job_id, stage="communities", progress=0.93)
+            with span("communities"):
+                try:
+                    stats['communities'] = await build_communities(document_id, graph_index)
+                except CommunityException as e:
+                    # Summaries only serve broad questions; the document is usable without them.
+                    LOG.warning("Skipping community summaries for document %s: %s", document_id, str(e))
+
+        # Registered last: the new version makes readers drop what they cached for the document.
+        await asyncio.to_thread(register_document, document_id, len(chunks), knowledge_graph, content_hash, url)
+        GRAPH_NODES.inc(len(knowledge_graph['nodes']))
+        GRAPH_EDGES.inc(len(knowledge_graph['edges']))
+        answer_cache.invalidate(document_id)
+
+        return {
+            "document_id": document_id,
+            "message": "PDF processed, embeddings created, and knowledge graph built",
+            "graph_stats": stats,
+            "duplicate": False
+        }
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self.converter_pool.shutdown()
@@ -0,0 +1,87 @@
+"""
+One-off migrations for existing LanceDB tables.
+
+Run with:  python -m app.services.migrations
+"""
+import json
+import logging
+from collections import Counter
+
+from app.services.document_store import add_document_fingerprints, get_document, register_document
+from app.services.embeddings import add_compact_vectors
+from app.services.graph_store import load_graph, save_graph
+from app.utils.resources import get_db
+
+logging.basicConfig(level=logging.INFO)
+LOG = logging.getLogger(__name__)
+
+
+def migrate_embedded_graphs(table_name: str = 'embeddings') -> int:
+    """
+    Move per-row `knowledge_graph` JSON blobs into the `nodes`/`edges` tables.
+
+    Each document's graph is stored once, then the `knowledge_graph` column is
+    dropped from the embeddings table and a `chunk_index` column is derived
+    from the `{document_id}_{idx}` row ids.
+
+    Returns:
+        int: Number of documents whose graph was migrated
+    """
+    if table_name not in get_db().table_names():
+        LOG.info("Table %s does not exist, nothing to migrate", table_name)
+        return 0
+
+    table = get_db().open_table(table_name)
+    if 'knowledge_graph' not in table.schema.names:
+        LOG.info("Table %s has no knowledge_graph column, nothing to migrate", table_name)
+        return 0
+
+    rows = table.search().select(["document_id", "knowledge_graph"]).limit(None).to_arrow()
+    migrated = set()
+    for document_id, graph_json in zip(rows.column("document_id").to_pylist(),
+                                       rows.column("knowledge_graph").to_pylist()):
+        if document_id in migrated:
+            continue
+        migrated.add(document_id)
+        if not graph_json:
+            LOG.warning("Document %s has no stored graph", document_id)
+            continue
+        save_graph(document_id, json.loads(graph_json))
+
+    if 'chunk_index' not in table.schema.names:
+        table.add_columns({"chunk_index": "CAST(regexp_replace(id, '^.*_', '') AS INT)"})
+    table.drop_columns(["knowledge_graph"])
+
+    LOG.info("Migrated graphs for %d documents out of %s", len(migrated), table_name)
+    return len(migrated)
+
+
+def backfill_documents(table_name: str = 'embeddings') -> int:
+    """
+    Register a `documents` row for every document in the embeddings table that
+    does not have one yet.
+
+    Returns:
+        int: Number of documents registered
+    """
+    if table_name not in get_db().table_names():
+        return 0
+
+    rows = get_db().open_table(table_name).search().select(["document_id"]).limit(None).to_arrow()
+    chunk_counts = Counter(rows.column("document_id").to_pylist())
+    registered = 0
+    for document_id, num_chunks in chunk_counts.items():
+        if get_document(document_id) is not None:
+            continue
+        register_document(document_id, num_chunks, load_graph(document_id))
+        registered += 1
+
+    LOG.info("Registered %d documents from %s", registered, table_name)
+    return registered
+
+
+if __name__ == "__main__":
+    migrate_embedded_graphs()
+    backfill_documents()
+    add_compact_vectors()
+    add_document_fingerprints()
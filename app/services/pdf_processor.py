@@ -1,40 +1,191 @@
+import asyncio
+import hashlib
+import multiprocessing
 import uuid
-from typing import Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 import requests
-from docling.document_converter import DocumentConverter
 from fastapi import HTTPException
 import os
 
-def download_pdf(url: str) -> Tuple[str, str]:
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.exceptions.RequestException:
-        raise HTTPException(status_code=400, detail="Failed to download PDF")
+from app.utils.config import Config
+
+if TYPE_CHECKING:
+    from docling.document_converter import DocumentConverter
+
+class PDFProcessingException(Exception):
+    """Raised by conversion code; unlike HTTPException it survives the trip back from a worker process."""
+    pass
+
+
+# Long-lived converter of the current process; docling loads its models once per instance.
+_converter: Optional["DocumentConverter"] = None
 
+
+def download_pdf(url: str) -> Tuple[str, str, str]:
+    """
+    Stream `url` to a temp file in fixed-size chunks, refusing bodies over MAX_PDF_BYTES.
+
+    Returns:
+        Tuple[str, str, str]: The file's path, a new document id and the sha256 of its content
+    """
     document_id = str(uuid.uuid4())
     pdf_path = f"temp/{document_id}.pdf"
     os.makedirs('temp', exist_ok=True)
-    with open(pdf_path, "wb") as f:
-        f.write(response.content)
-    return pdf_path, document_id
 
-def extract_text_from_pdf(pdf_path: str) -> str:
     try:
-        converter = DocumentConverter()
-        converter_output = converter.convert(pdf_path)
-        text_pieces = []
+        with requests.get(url, stream=True, timeout=Config.PDF_DOWNLOAD_TIMEOUT_SECONDS) as response:
+            response.raise_for_status()
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > Config.MAX_PDF_BYTES:
+                raise HTTPException(status_code=413, detail="PDF exceeds the maximum allowed size")
+
+            received = 0
+            digest = hashlib.sha256()
+            with open(pdf_path, "wb") as f:
+                for block in response.iter_content(chunk_size=Config.PDF_DOWNLOAD_CHUNK_BYTES):
+                    received += len(block)
+                    if received > Config.MAX_PDF_BYTES:
+                        raise HTTPException(status_code=413, detail="PDF exceeds the maximum allowed size")
+                    digest.update(block)
+                    f.write(block)
+    except (requests.exceptions.RequestException, HTTPException) as e:
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail="Failed to download PDF")
+
+    return pdf_path, document_id, digest.hexdigest()
+
+
+def get_converter() -> "DocumentConverter":
+    global _converter
+    if _converter is None:
+        # docling pulls in torch and its models; only converter processes import it.
+        from docling.document_converter import DocumentConverter
+
+        _converter = DocumentConverter()
+    return _converter
+
+
+def init_converter_worker():
+    """Process pool initializer: build the converter and load the PDF pipeline up front."""
+    from docling.datamodel.base_models import InputFormat
+
+    get_converter().initialize_pipeline(InputFormat.PDF)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(pdf_path)
+    try:
+        return len(document)
+    finally:
+        document.close()
+
+
+def iter_pdf_text(pdf_path: str, page_range: Optional[Tuple[int, int]] = None) -> Iterator[str]:
+    """Yield the text of the document's body elements in reading order.
+
+    `page_range` is an inclusive, 1-based (first, last) page pair; all pages by default.
+    """
+    try:
+        converter = get_converter()
+        if page_range:
+            converter_output = converter.convert(pdf_path, page_range=page_range)
+        else:
+            converter_output = converter.convert(pdf_path)
         assembled_data = converter_output.assembled
         body_elements = assembled_data.body  # List of TextElement objects
         for element in body_elements:
             text = element.text  # Access the 'text' attribute
             if text:
-                text_pieces.append(text)
-        doc_text = '\n'.join(text_pieces)
+                yield text
+    except Exception as e:
+        raise PDFProcessingException(f"Failed to process PDF: {str(e)}")
 
-        if not doc_text.strip():
-            raise HTTPException(status_code=400, detail="The document contains no text")
 
-        return doc_text
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+def convert_pdf_pages(pdf_path: str, page_range: Optional[Tuple[int, int]] = None) -> List[str]:
+    """Picklable entry point for worker processes."""
+    return list(iter_pdf_text(pdf_path, page_range))
+
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    try:
+        doc_text = '\n'.join(iter_pdf_text(pdf_path))
+    except PDFProcessingException as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not doc_text.strip():
+        raise HTTPException(status_code=400, detail="The document contains no text")
+
+    return doc_text
+
+
+class ConverterPool:
+    """
+    Worker processes that each hold one pre-warmed DocumentConverter.
+
+    Documents longer than PDF_PAGES_PER_TASK pages are converted as page
+    ranges spread over the workers and reassembled in page order.
+    """
+
+    def __init__(self, workers: int = None, pages_per_task: int = None):
+        self.workers = workers or Config.INGESTION_PROCESS_WORKERS
+        self.pages_per_task = pages_per_task or Config.PDF_PAGES_PER_TASK
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs LanceDB/HTTP threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_converter_worker
+            )
+        return self._executor
+
+    async def warm_up(self):
+        """Start every worker now so the first upload does not pay for model loading."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(self.workers)))
+
+    def _page_ranges(self, num_pages: int) -> List[Tuple[int, int]]:
+        return [
+            (first, min(first + self.pages_per_task - 1, num_pages))
+            for first in range(1, num_pages + 1, self.pages_per_task)
+        ]
+
+    async def convert(self, pdf_path: str) -> List[str]:
+        """Return the document's text elements in reading order."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        try:
+            num_pages = await asyncio.to_thread(count_pdf_pages, pdf_path)
+        except Exception:
+            num_pages = 0
+        page_ranges = self._page_ranges(num_pages) if num_pages > self.pages_per_task else [None]
+
+        try:
+            parts = await asyncio.gather(*(
+                loop.run_in_executor(executor, convert_pdf_pages, pdf_path, page_range)
+                for page_range in page_ranges
+            ))
+        except PDFProcessingException as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        except BrokenProcessPool:
+            # A worker died mid-conversion; start a fresh pool for the next document.
+            if self._executor is executor:
+                self.shutdown()
+            raise HTTPException(status_code=500, detail="Failed to process PDF: the converter process exited")
+        return [text for part in parts for text in part]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,26 +1,158 @@
-from typing import List, Dict
-from app.utils.config import db
-from app.utils.embedding_utils import get_embedding
+import asyncio
+from typing import Dict, List, Sequence
 
+import numpy as np
+import pyarrow as pa
+
+from app.services.embeddings import COMPACT_COLUMNS, EMBEDDINGS_TABLE, SCALE_COLUMN, arrow_to_vectors, compact_kinds
+from app.services.index_manager import document_filter, quote
+from app.utils.config import Config
+from app.utils.resources import get_async_db
+from app.utils.embedding_utils import aget_embedding
+
+# Columns returned for each hit unless the caller asks for others.
+DEFAULT_COLUMNS = ("text", "chunk_index")
+# Rows of int8 codes dequantized at a time when scoring.
+_SCORE_BLOCK_ROWS = 4096
+
+
+async def retrieve_similar_texts(document_id: str, query: str, top_n: int = 5, num_chunks: int = None,
+                                 columns: Sequence[str] = DEFAULT_COLUMNS) -> List[Dict]:
+    """
+    Return the `top_n` chunks of a document closest to `query`.
+
+    `num_chunks` is the document's chunk count when known; small documents are
+    searched exactly over their own rows rather than through the ANN index.
+    """
+    try:
+        query_vector = await aget_embedding(query)
+    except Exception as e:
+        raise Exception(f"Error retrieving similar texts: {str(e)}")
+    return await search_similar_texts(document_id, query_vector, top_n, num_chunks, columns)
+
+
+async def search_similar_texts(document_id: str, query_vector, top_n: int = 5, num_chunks: int = None,
+                               columns: Sequence[str] = DEFAULT_COLUMNS) -> List[Dict]:
+    """
+    Same as `retrieve_similar_texts` for an already embedded query.
+
+    Only `columns` (and `_distance`) are read back for the hits.
+    """
+    if num_chunks is not None and num_chunks <= Config.FLAT_SEARCH_MAX_ROWS:
+        return (await retrieve_similar_texts_batch(document_id, np.asarray([query_vector]), top_n, num_chunks,
+                                                   columns))[0]
+
+    try:
+        table = await (await get_async_db()).open_table(EMBEDDINGS_TABLE)
+        results = await table.vector_search(
+            np.asarray(query_vector, dtype=np.float32)
+        ).column("vector").distance_type("cosine").where(
+            document_filter(document_id)
+        ).nprobes(Config.VECTOR_SEARCH_NPROBES).refine_factor(
+            Config.VECTOR_SEARCH_REFINE_FACTOR
+        ).select(list(columns)).limit(top_n).to_arrow()
+
+        return results.to_pylist()
+
+    except Exception as e:
+        raise Exception(f"Error retrieving similar texts: {str(e)}")
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _compact_similarity(rows: pa.Table, kind: str, queries: np.ndarray) -> np.ndarray:
+    """Approximate (num queries, num rows) cosine similarity from the compact vectors."""
+    vectors = arrow_to_vectors(rows.column(COMPACT_COLUMNS[kind]))
+    if kind == "float16":
+        return queries @ vectors.astype(np.float32).T
+
+    scales = rows.column(SCALE_COLUMN).to_numpy()
+    similarity = np.empty((len(queries), rows.num_rows), dtype=np.float32)
+    # Dequantize a block at a time to bound the temporary float32 copy.
+    for start in range(0, rows.num_rows, _SCORE_BLOCK_ROWS):
+        block = slice(start, start + _SCORE_BLOCK_ROWS)
+        similarity[:, block] = (queries @ vectors[block].astype(np.float32).T) * scales[block]
+    return similarity
+
+
+def _top_k(similarity: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of each row's `k` largest values, best first."""
+    k = min(k, similarity.shape[1])
+    top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(similarity, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _id_filter(document_id: str, chunk_indices) -> str:
+    ids = ", ".join(quote(f"{document_id}_{i}") for i in sorted(set(chunk_indices)))
+    return f"{document_filter(document_id)} AND id IN ({ids})"
+
+
+async def retrieve_similar_texts_batch(document_id: str, query_vectors: np.ndarray, top_n: int = 5,
+                                       num_chunks: int = None,
+                                       columns: Sequence[str] = DEFAULT_COLUMNS) -> List[List[Dict]]:
+    """
+    Return the `top_n` closest chunks for each row of `query_vectors`.
+
+    Documents small enough for exact search are scored against every query
+    in one matrix product over the vectors alone. With VECTOR_COMPACT that
+    pass reads the compact vectors, and the best top_n * VECTOR_RERANK_FACTOR
+    candidates are re-ranked with their full vectors. The requested `columns`
+    are then read for the hits only. Larger documents fall back to
+    concurrent ANN searches, one per query.
+    """
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    if num_chunks is None or num_chunks > Config.FLAT_SEARCH_MAX_ROWS:
+        return list(await asyncio.gather(*(
+            search_similar_texts(document_id, vector, top_n, num_chunks, columns) for vector in query_vectors
+        )))
 
-def retrieve_similar_texts(document_id: str, query: str, top_n: int = 5) -> List[Dict]:
     try:
-        query_vector = get_embedding(query)
-        table = db.open_table('embeddings')
-        results_df = table.search(
-            query_vector,
-            vector_column_name="vector",
-        ).where(
-            f"document_id = '{document_id}'",
-            prefilter=True
-        ).select(
-            ["text", "vector", "knowledge_graph"]
-        ).limit(top_n).to_pandas()
-
-        if results_df.empty:
-            return []
-
-        return results_df.to_dict('records')
+        table = await (await get_async_db()).open_table(EMBEDDINGS_TABLE)
+        kind = Config.VECTOR_COMPACT if Config.VECTOR_COMPACT in compact_kinds(await table.schema()) else None
+        queries = _unit_rows(query_vectors)
+
+        score_columns = ["vector"] if kind is None else [COMPACT_COLUMNS[kind]] + ([SCALE_COLUMN] if kind == "int8" else [])
+        rows = await table.query().where(
+            document_filter(document_id)
+        ).select(["chunk_index"] + score_columns).to_arrow()
+        if rows.num_rows == 0:
+            return [[] for _ in query_vectors]
+
+        if kind is None:
+            similarity = await asyncio.to_thread(lambda: queries @ _unit_rows(arrow_to_vectors(rows.column("vector"))).T)
+            chunk_indices = rows.column("chunk_index").to_numpy()
+        else:
+            approximate = await asyncio.to_thread(_compact_similarity, rows, kind, queries)
+            candidates = rows.column("chunk_index").to_numpy()[_top_k(approximate, top_n * Config.VECTOR_RERANK_FACTOR)]
+            exact = await table.query().where(
+                _id_filter(document_id, candidates.ravel())
+            ).select(["chunk_index", "vector"]).to_arrow()
+            similarity = queries @ _unit_rows(arrow_to_vectors(exact.column("vector"))).T
+            chunk_indices = exact.column("chunk_index").to_numpy()
+            # Only score each query against its own candidates.
+            own = np.array([np.isin(chunk_indices, row) for row in candidates])
+            similarity = np.where(own, similarity, -np.inf)
+
+        best = _top_k(similarity, top_n)
+        hits = chunk_indices[best]
+        scores = np.take_along_axis(similarity, best, axis=1)
+
+        fetched = await table.query().where(
+            _id_filter(document_id, hits.ravel())
+        ).select(sorted(set(columns) | {"chunk_index"})).to_arrow()
+        by_chunk = dict(zip(fetched.column("chunk_index").to_pylist(), fetched.to_pylist()))
+
+        return [
+            [
+                {**{name: by_chunk[chunk][name] for name in columns}, "_distance": float(1.0 - score)}
+                for chunk, score in zip(row_hits.tolist(), row_scores.tolist()) if np.isfinite(score)
+            ]
+            for row_hits, row_scores in zip(hits, scores)
+        ]
 
     except Exception as e:
-        raise Exception(f"Error retrieving similar texts: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error retrieving similar texts: {str(e)}")
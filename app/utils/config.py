@@ -1,13 +1,161 @@
 import os
 from dotenv import load_dotenv
-import lancedb
 
 load_dotenv()
 
 class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Alternative OpenAI-compatible endpoint, e.g. the benchmark stand-in server.
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
     DATABASE_URL = os.getenv("DATABASE_URL")
 
-db= lancedb.connect(Config.DATABASE_URL)
+    # Tokens shared between consecutive chunks produced by text_splitter.
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "100"))
+
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    # Let the embeddings client tokenize inputs (with tiktoken) and split those over
+    # the model's context length. Chunks are already capped by text_splitter.
+    EMBEDDING_CHECK_CTX_LENGTH = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "true").lower() == "true"
+    # Upper bounds for a single embeddings request: number of inputs and
+    # (approximate) number of tokens across all inputs.
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+    EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "250000"))
+    # Number of embedding batches in flight at the same time.
+    EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    # Local LanceDB directory backing the on-disk tier of the embedding cache.
+    EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+    EMBEDDING_CACHE_MEMORY_BYTES = int(os.getenv("EMBEDDING_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+    # Each write to the disk tier adds a small fragment; compact them every this many writes.
+    EMBEDDING_CACHE_COMPACT_EVERY = int(os.getenv("EMBEDDING_CACHE_COMPACT_EVERY", "50"))
+
+    # Chunks sent to the LLM for entity extraction at the same time, and how
+    # often a chunk whose reply is not valid extraction JSON is retried (with
+    # exponential backoff) before it is skipped. API errors are retried by the
+    # OpenAI scheduler (OPENAI_MAX_RETRIES).
+    GRAPH_EXTRACTION_CONCURRENCY = int(os.getenv("GRAPH_EXTRACTION_CONCURRENCY", "8"))
+    GRAPH_EXTRACTION_MAX_RETRIES = int(os.getenv("GRAPH_EXTRACTION_MAX_RETRIES", "3"))
+    GRAPH_EXTRACTION_BACKOFF_SECONDS = float(os.getenv("GRAPH_EXTRACTION_BACKOFF_SECONDS", "1.0"))
+    # Store each chunk's extraction by content hash, so re-uploading an edited
+    # document only sends its new or changed chunks to the LLM.
+    EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    # Entities of the same type whose name embeddings are at least this similar
+    # are merged during graph build; 0 merges on normalized name and type only.
+    ENTITY_RESOLUTION_SIMILARITY = float(os.getenv("ENTITY_RESOLUTION_SIMILARITY", "0.95"))
+
+    # Number of parsed per-document graphs kept in memory for /answer.
+    GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "32"))
+
+    # Indexes are only worth building once a table has this many rows.
+    SCALAR_INDEX_MIN_ROWS = int(os.getenv("SCALAR_INDEX_MIN_ROWS", "1000"))
+    VECTOR_INDEX_MIN_ROWS = int(os.getenv("VECTOR_INDEX_MIN_ROWS", "50000"))
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "IVF_PQ")
+    # Fold new rows into the ANN index once they exceed this fraction of the
+    # indexed rows; rebuild it with new partitions once the table has grown by
+    # this factor.
+    VECTOR_INDEX_REFRESH_FRACTION = float(os.getenv("VECTOR_INDEX_REFRESH_FRACTION", "0.1"))
+    VECTOR_INDEX_RETRAIN_GROWTH = float(os.getenv("VECTOR_INDEX_RETRAIN_GROWTH", "2.0"))
+    # Documents with at most this many chunks are searched exactly (prefiltered
+    # by the document_id index) instead of through the ANN index.
+    FLAT_SEARCH_MAX_ROWS = int(os.getenv("FLAT_SEARCH_MAX_ROWS", "10000"))
+    VECTOR_SEARCH_NPROBES = int(os.getenv("VECTOR_SEARCH_NPROBES", "20"))
+    VECTOR_SEARCH_REFINE_FACTOR = int(os.getenv("VECTOR_SEARCH_REFINE_FACTOR", "5"))
+    # Compact copy of the chunk vectors ("float16", "int8" or "none") that exact
+    # searches scan first; the best top_n * VECTOR_RERANK_FACTOR candidates are then
+    # re-ranked with the full float32 vectors. Existing tables get the column from
+    # `python -m app.services.migrations`.
+    VECTOR_COMPACT = os.getenv("VECTOR_COMPACT", "none").lower()
+    VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+    # Answer prompts: retrieved chunks are cut into passages of at most
+    # CONTEXT_PASSAGE_TOKENS, scored against the question, de-duplicated (passages
+    # at least CONTEXT_DEDUP_SIMILARITY alike) and packed into CONTEXT_TOKEN_BUDGET
+    # tokens together with the graph context, which may use at most
+    # CONTEXT_GRAPH_SHARE of the budget; what it leaves goes to the document.
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    CONTEXT_GRAPH_SHARE = float(os.getenv("CONTEXT_GRAPH_SHARE", "0.25"))
+    CONTEXT_PASSAGE_TOKENS = int(os.getenv("CONTEXT_PASSAGE_TOKENS", "128"))
+    CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))
+
+    # Local graph retrieval: number of seed entities, expansion depth, nodes kept
+    # per seed, per-hop score decay and the minimum query/entity similarity.
+    GRAPH_QUERY_SEEDS = int(os.getenv("GRAPH_QUERY_SEEDS", "5"))
+    GRAPH_QUERY_HOPS = int(os.getenv("GRAPH_QUERY_HOPS", "2"))
+    GRAPH_QUERY_MAX_NODES = int(os.getenv("GRAPH_QUERY_MAX_NODES", "10"))
+    GRAPH_QUERY_DECAY = float(os.getenv("GRAPH_QUERY_DECAY", "0.7"))
+    GRAPH_QUERY_MIN_SIMILARITY = float(os.getenv("GRAPH_QUERY_MIN_SIMILARITY", "0.7"))
+
+    # Whole-document questions: after ingestion the graph is partitioned into
+    # communities (label propagation, at most COMMUNITY_MAX_ITERATIONS rounds) and
+    # the COMMUNITY_MAX_COUNT largest with at least COMMUNITY_MIN_SIZE entities are
+    # summarized once by the LLM. Broad questions are answered from those summaries.
+    COMMUNITIES_ENABLED = os.getenv("COMMUNITIES_ENABLED", "true").lower() == "true"
+    COMMUNITY_MIN_SIZE = int(os.getenv("COMMUNITY_MIN_SIZE", "3"))
+    COMMUNITY_MAX_COUNT = int(os.getenv("COMMUNITY_MAX_COUNT", "30"))
+    COMMUNITY_MAX_ITERATIONS = int(os.getenv("COMMUNITY_MAX_ITERATIONS", "20"))
+
+    # Background ingestion: jobs processed at once, docling worker processes, and
+    # the SQLite file for job records (in-memory when unset).
+    INGESTION_MAX_CONCURRENT_JOBS = int(os.getenv("INGESTION_MAX_CONCURRENT_JOBS", "2"))
+    INGESTION_PROCESS_WORKERS = int(os.getenv("INGESTION_PROCESS_WORKERS", "2"))
+    JOB_STORE_PATH = os.getenv("JOB_STORE_PATH")
+    # Ingestion progress is written to the job store at most this often.
+    JOB_PROGRESS_INTERVAL_SECONDS = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "1.0"))
+
+    # PDF download limits and conversion: documents longer than PDF_PAGES_PER_TASK
+    # pages are converted as page ranges in parallel across the worker processes.
+    MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(100 * 1024 * 1024)))
+    PDF_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("PDF_DOWNLOAD_TIMEOUT_SECONDS", "60"))
+    PDF_DOWNLOAD_CHUNK_BYTES = int(os.getenv("PDF_DOWNLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+    PDF_CONVERTER_PREWARM = os.getenv("PDF_CONVERTER_PREWARM", "true").lower() == "true"
+
+    # Semantic answer cache: a question whose embedding is at least this similar to
+    # an already answered one for the same document version reuses that answer.
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MAX_PER_DOCUMENT = int(os.getenv("ANSWER_CACHE_MAX_PER_DOCUMENT", "5000"))
+    ANSWER_CACHE_MAX_DOCUMENTS = int(os.getenv("ANSWER_CACHE_MAX_DOCUMENTS", "256"))
+
+    # /answer/batch: questions accepted per request and answers generated at once.
+    BATCH_ANSWER_MAX_QUERIES = int(os.getenv("BATCH_ANSWER_MAX_QUERIES", "100"))
+    BATCH_ANSWER_MAX_CONCURRENCY = int(os.getenv("BATCH_ANSWER_MAX_CONCURRENCY", "8"))
+
+    # Pooled HTTP connections of the async OpenAI clients.
+    OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+    OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+
+    # Client-side OpenAI rate limits per pool (requests and tokens per minute, 0 for
+    # unlimited) and the most calls in flight. A 429 halves the calls allowed in
+    # flight, which then grow back on success; rate-limited and transient failures
+    # are retried this many times. Chat calls are charged their prompt plus this
+    # many completion tokens up front and corrected by the reported usage.
+    OPENAI_CHAT_RPM = int(os.getenv("OPENAI_CHAT_RPM", "3500"))
+    OPENAI_CHAT_TPM = int(os.getenv("OPENAI_CHAT_TPM", "160000"))
+    OPENAI_CHAT_MAX_CONCURRENCY = int(os.getenv("OPENAI_CHAT_MAX_CONCURRENCY", "32"))
+    OPENAI_EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+    OPENAI_EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+    OPENAI_EMBEDDING_MAX_CONCURRENCY = int(os.getenv("OPENAI_EMBEDDING_MAX_CONCURRENCY", "16"))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+    OPENAI_RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("OPENAI_RATE_LIMIT_BACKOFF_SECONDS", "1.0"))
+    OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "300"))
+
+    # Startup: shared clients are created on first use; when enabled, the listed
+    # ones are loaded in the background at startup and /ready reports 503 until
+    # they are. `python -m app.utils.import_time` fails above the import budget.
+    WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+    WARM_UP_RESOURCES = [
+        name.strip()
+        for name in os.getenv("WARM_UP_RESOURCES", "db,tokenizer,llm,embeddings,graph_service,ingestion").split(",")
+        if name.strip()
+    ]
+    IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "2.0"))
+
+    # Write one JSON line per timed span (pipeline stage, LLM or embedding call)
+    # to the `app.trace` logger. Metrics at /metrics are always collected.
+    TRACE_LOG_ENABLED = os.getenv("TRACE_LOG_ENABLED", "false").lower() == "true"
+
 
 config = Config()
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from app.services.index_manager import ensure_scalar_indexes, quote
+from app.utils.config import Config
+from app.utils.metrics import register_collector
+
+LOG = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# LanceDB filter strings get long quickly; look keys up in slices of this size.
+_LOOKUP_SLICE = 500
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, collapsed whitespace, stripped."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(text: str, model: str = None) -> str:
+    model = model or Config.EMBEDDING_MODEL
+    payload = f"{model}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+
+    The memory tier is an LRU bounded by the total bytes of cached vectors; the
+    disk tier is a local LanceDB table that survives restarts and is shared by
+    every worker on the host.
+    """
+
+    TABLE_NAME = "embedding_cache"
+
+    def __init__(self, directory: str = None, max_memory_bytes: int = None):
+        self.directory = directory or Config.EMBEDDING_CACHE_DIR
+        self.max_memory_bytes = max_memory_bytes or Config.EMBEDDING_CACHE_MEMORY_BYTES
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._table = None
+        self._disk_writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _get_table(self, create: bool = False):
+        if self._table is None:
+            if self._db is None:
+                import lancedb
+
+                self._db = lancedb.connect(self.directory)
+            if self.TABLE_NAME in self._db.table_names():
+                self._table = self._db.open_table(self.TABLE_NAME)
+            elif create:
+                schema = pa.schema([
+                    pa.field("key", pa.string()),
+                    pa.field("vector", pa.list_(pa.float32()))
+                ])
+                self._table = self._db.create_table(self.TABLE_NAME, schema=schema, exist_ok=True)
+        return self._table
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous.nbytes
+            self._memory[key] = vector
+            self._memory_bytes += vector.nbytes
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever of `keys` are known."""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        if missing:
+            try:
+                from_disk = self._read_disk(missing)
+            except Exception as e:
+                LOG.warning("Embedding cache disk lookup failed: %s", str(e))
+                from_disk = {}
+            for key, vector in from_disk.items():
+                self._remember(key, vector)
+            found.update(from_disk)
+            with self._lock:
+                self.disk_hits += len(from_disk)
+                self.misses += len(missing) - len(from_disk)
+
+        return found
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        if not vectors:
+            return
+        for key, vector in vectors.items():
+            self._remember(key, np.asarray(vector, dtype=np.float32))
+        try:
+            self._write_disk(vectors)
+        except Exception as e:
+            LOG.warning("Embedding cache disk write failed: %s", str(e))
+
+    def put(self, key: str, vector: np.ndarray):
+        self.put_many({key: vector})
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        table = self._get_table()
+        if table is None:
+            return {}
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_SLICE):
+            in_list = ", ".join(quote(key) for key in keys[start:start + _LOOKUP_SLICE])
+            rows = table.search().where(f"key IN ({in_list})").select(["key", "vector"]).limit(None).to_arrow()
+            for key, vector in zip(rows.column("key").to_pylist(), rows.column("vector").to_pylist()):
+                found[key] = np.asarray(vector, dtype=np.float32)
+        return found
+
+    def _write_disk(self, vectors: Dict[str, np.ndarray]):
+        table = self._get_table(create=True)
+        data = pa.table({
+            "key": pa.array(list(vectors.keys()), type=pa.string()),
+            "vector": pa.array([np.asarray(v, dtype=np.float32) for v in vectors.values()],
+                               type=pa.list_(pa.float32()))
+        })
+        table.merge_insert("key").when_not_matched_insert_all().execute(data)
+        # Lookups filter on `key`: index it, like the extraction cache.
+        ensure_scalar_indexes(table, ["key"])
+
+        with self._lock:
+            self._disk_writes += 1
+            compact = self._disk_writes % Config.EMBEDDING_CACHE_COMPACT_EVERY == 0
+        if compact:
+            LOG.info("Compacting %s after %d writes", self.TABLE_NAME, self._disk_writes)
+            table.optimize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes
+            }
+
+
+embedding_cache = EmbeddingCache()
+
+
+def _collect_metrics():
+    stats = embedding_cache.stats()
+    return [
+        ("graphrag_embedding_cache_lookups_total", "counter", "Embedding cache lookups by result.", [
+            ({"result": "memory_hit"}, stats["memory_hits"]),
+            ({"result": "disk_hit"}, stats["disk_hits"]),
+            ({"result": "miss"}, stats["misses"])
+        ]),
+        ("graphrag_embedding_cache_memory_bytes", "gauge", "Bytes held by the in-memory embedding cache.",
+         [({}, stats["memory_bytes"])])
+    ]
+
+
+register_collector(_collect_metrics)
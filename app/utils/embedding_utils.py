@@ -1,20 +1,117 @@
-from langchain_openai import OpenAIEmbeddings
+import asyncio
 from numpy import ndarray, dtype, floating
 
 from app.utils.config import Config
+from app.utils.embedding_cache import cache_key, embedding_cache
+from app.utils.metrics import embedding_call
+from app.utils.openai_scheduler import embedding_scheduler, estimate_tokens, request_key
+from app.utils.resources import get_embeddings_client
 import numpy as np
-from typing import Any
+from typing import Any, Iterator, List
 
 
-def get_embedding(text: str) -> ndarray[Any, dtype[Any]]:
+async def aget_embedding(text: str) -> ndarray[Any, dtype[Any]]:
+    """Embed one text through the embedding cache (looked up off the event loop) and the embedding scheduler."""
     try:
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=Config.OPENAI_API_KEY,
-            model='text-embedding-ada-002'
-        )
-        embedding = embeddings.embed_query(text)
+        key = cache_key(text)
+        if Config.EMBEDDING_CACHE_ENABLED:
+            cached = await asyncio.to_thread(embedding_cache.get, key)
+            if cached is not None:
+                return cached
+
+        tokens = estimate_tokens(text)
+
+        async def request() -> List[float]:
+            with embedding_call(1, tokens):
+                return await get_embeddings_client().aembed_query(text)
+
+        embedding = await embedding_scheduler.call(request, tokens, key=request_key("query", text))
         embedding_array = np.array(embedding, dtype=np.float32)
 
+        if Config.EMBEDDING_CACHE_ENABLED:
+            await asyncio.to_thread(embedding_cache.put, key, embedding_array)
         return embedding_array
     except Exception as e:
-        raise Exception(f"Error generating embedding: {e}")
\ No newline at end of file
+        raise Exception(f"Error generating embedding: {e}")
+
+
+def iter_batches(texts: List[str],
+                 max_size: int = None,
+                 max_tokens: int = None) -> Iterator[range]:
+    """Yield index ranges over `texts` bounded by input count and token estimate."""
+    max_size = max_size or Config.EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or Config.EMBEDDING_BATCH_MAX_TOKENS
+
+    start = 0
+    batch_tokens = 0
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if idx > start and (idx - start >= max_size or batch_tokens + tokens > max_tokens):
+            yield range(start, idx)
+            start = idx
+            batch_tokens = 0
+        batch_tokens += tokens
+    if start < len(texts):
+        yield range(start, len(texts))
+
+
+async def aget_embeddings(texts: List[str], max_concurrency: int = None) -> ndarray[Any, dtype[floating]]:
+    """
+    Embed `texts` in size-bounded batches with a bounded number of requests in flight.
+
+    Texts already present in the embedding cache, and duplicates within `texts`,
+    are not sent to the API.
+
+    Returns:
+        np.ndarray: C-contiguous float32 matrix of shape (len(texts), dim), row i
+        being the embedding of texts[i].
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    keys = [cache_key(text) for text in texts]
+    cached = {}
+    if Config.EMBEDDING_CACHE_ENABLED:
+        cached = await asyncio.to_thread(embedding_cache.get_many, keys)
+
+    # One API input per distinct uncached key.
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in pending:
+            pending[key] = text
+    pending_keys = list(pending.keys())
+    pending_texts = list(pending.values())
+
+    client = get_embeddings_client()
+    semaphore = asyncio.Semaphore(max_concurrency or Config.EMBEDDING_MAX_CONCURRENCY)
+    batches = list(iter_batches(pending_texts))
+
+    async def embed_batch(batch: range) -> List[List[float]]:
+        texts_batch = [pending_texts[i] for i in batch]
+        tokens = sum(map(estimate_tokens, texts_batch))
+
+        async def request() -> List[List[float]]:
+            with embedding_call(len(texts_batch), tokens):
+                return await client.aembed_documents(texts_batch)
+
+        async with semaphore:
+            return await embedding_scheduler.call(request, tokens, key=request_key("documents", texts_batch))
+
+    try:
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    except Exception as e:
+        raise Exception(f"Error generating embeddings: {e}")
+
+    fresh = {}
+    for batch, vectors in zip(batches, results):
+        for i, vector in zip(batch, vectors):
+            fresh[pending_keys[i]] = np.asarray(vector, dtype=np.float32)
+    if fresh and Config.EMBEDDING_CACHE_ENABLED:
+        await asyncio.to_thread(embedding_cache.put_many, fresh)
+
+    vectors_by_key = {**cached, **fresh}
+    dimension = len(vectors_by_key[keys[0]])
+    matrix = np.empty((len(texts), dimension), dtype=np.float32)
+    for row, key in enumerate(keys):
+        matrix[row] = vectors_by_key[key]
+    return matrix
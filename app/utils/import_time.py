@@ -0,0 +1,57 @@
+"""
+Measure how long importing the application takes in a fresh interpreter.
+
+    python -m app.utils.import_time [module] [--top N]
+
+Prints the cumulative import time of `module` (default: main) and its slowest
+imports, and exits with status 1 when it exceeds IMPORT_TIME_BUDGET_SECONDS.
+"""
+import argparse
+import re
+import subprocess
+import sys
+from typing import List, Tuple
+
+from app.utils.config import Config
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_import_time(module: str = "main") -> List[Tuple[str, int, float]]:
+    """Return (module, depth, cumulative seconds) for every import made by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}: {result.stderr.strip().splitlines()[-1]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            timings.append((match.group(4), depth, int(match.group(2)) / 1e6))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=Config.IMPORT_TIME_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    timings = measure_import_time(args.module)
+    total = next(seconds for name, depth, seconds in timings if name == args.module and depth == 0)
+    print(f"import {args.module}: {total:.3f}s (budget {args.budget:.3f}s)")
+    for name, depth, seconds in sorted(timings, key=lambda t: -t[2])[1:args.top + 1]:
+        print(f"  {seconds:8.3f}s  {name}")
+
+    if total > args.budget:
+        print("Import time budget exceeded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
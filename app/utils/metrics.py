@@ -0,0 +1,237 @@
+"""
+In-process metrics in the Prometheus text format, plus timing spans.
+
+Counters and histograms are plain locked dicts keyed by label values, cheap
+enough to update on every LLM call. `render()` produces the /metrics body.
+`span()` times a block into STAGE_SECONDS and, with TRACE_LOG_ENABLED,
+writes one JSON line per span to the `app.trace` logger, tagged with the
+current trace id (the request or ingestion job being processed).
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.utils.config import Config
+
+TRACE_LOG = logging.getLogger("app.trace")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts with a trailing +Inf slot, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                cumulative += counts[-1]
+                le = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# Collectors return (name, type, help, [(labels, value)]) for values owned elsewhere, read at scrape time.
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+_metrics: List[Any] = []
+_collectors: List[Collector] = []
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, documentation, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector: Collector):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = histogram("graphrag_stage_seconds", "Duration of pipeline stages.", ["stage"])
+LLM_CALL_SECONDS = histogram("graphrag_llm_call_seconds", "Duration of chat model calls.", ["operation"])
+LLM_TOKENS = counter("graphrag_llm_tokens_total", "Chat model tokens, as reported by the API.",
+                     ["operation", "direction"])
+LLM_ERRORS = counter("graphrag_llm_errors_total", "Failed chat model calls.", ["operation"])
+EMBEDDING_CALL_SECONDS = histogram("graphrag_embedding_call_seconds", "Duration of embedding API calls.")
+EMBEDDING_INPUTS = counter("graphrag_embedding_inputs_total", "Texts sent to the embedding API.")
+EMBEDDING_TOKENS = counter("graphrag_embedding_tokens_total", "Estimated tokens sent to the embedding API.")
+EMBEDDING_ERRORS = counter("graphrag_embedding_errors_total", "Failed embedding API calls.")
+CHUNKS = counter("graphrag_chunks_total", "Chunks produced by ingestion.")
+CHUNKS_REUSED = counter("graphrag_chunks_reused_total",
+                        "Chunks whose extraction or vector was reused from an earlier upload.", ["stage"])
+GRAPH_NODES = counter("graphrag_graph_nodes_total", "Knowledge graph nodes stored by ingestion.")
+GRAPH_EDGES = counter("graphrag_graph_edges_total", "Knowledge graph edges stored by ingestion.")
+INGESTION_JOBS = counter("graphrag_ingestion_jobs_total", "Finished ingestion jobs.", ["status"])
+OPENAI_QUEUE_SECONDS = histogram("graphrag_openai_queue_seconds", "Time OpenAI calls waited for admission.",
+                                 ["scheduler", "priority"])
+OPENAI_RATE_LIMITED = counter("graphrag_openai_rate_limited_total", "OpenAI calls rejected with a 429.", ["scheduler"])
+OPENAI_COALESCED = counter("graphrag_openai_coalesced_total", "OpenAI calls answered by an identical in-flight call.",
+                           ["scheduler"])
+HTTP_REQUEST_SECONDS = histogram("graphrag_http_request_seconds", "HTTP request duration.",
+                                 ["method", "route", "status"])
+
+
+@contextmanager
+def trace(trace_id: str = None) -> Iterator[str]:
+    """Tag spans in this block (and tasks started from it) with `trace_id`."""
+    trace_id = trace_id or uuid.uuid4().hex
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+@contextmanager
+def span(name: str, histogram_metric: Histogram = None, **labels) -> Iterator[Dict[str, Any]]:
+    """
+    Time the block into `histogram_metric` (STAGE_SECONDS by `name` by default).
+
+    Yields a dict the block can add attributes to; they go into the trace log.
+    """
+    attributes: Dict[str, Any] = {}
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _current_span.reset(token)
+        if histogram_metric is None:
+            STAGE_SECONDS.observe(seconds, stage=name)
+        else:
+            histogram_metric.observe(seconds, **labels)
+        if Config.TRACE_LOG_ENABLED:
+            record = {"trace_id": _trace_id.get(), "span": name, "parent": parent,
+                      "duration_ms": round(seconds * 1000, 3), **labels, **attributes}
+            if error:
+                record["error"] = error
+            TRACE_LOG.info(json.dumps(record, default=str))
+
+
+def record_llm_usage(operation: str, response: Any):
+    """Count the tokens of a langchain chat response (or merged stream chunk) by its usage metadata."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), operation=operation, direction="sent")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), operation=operation, direction="received")
+
+
+@contextmanager
+def llm_call(operation: str) -> Iterator[Dict[str, Any]]:
+    """Span around one chat model call; failures are counted in LLM_ERRORS."""
+    try:
+        with span(f"llm.{operation}", LLM_CALL_SECONDS, operation=operation) as attributes:
+            yield attributes
+    except Exception:
+        LLM_ERRORS.inc(operation=operation)
+        raise
+
+
+@contextmanager
+def embedding_call(inputs: int, tokens: int) -> Iterator[Dict[str, Any]]:
+    """Span around one embedding API request of `inputs` texts totalling about `tokens` tokens."""
+    EMBEDDING_INPUTS.inc(inputs)
+    EMBEDDING_TOKENS.inc(tokens)
+    try:
+        with span("embedding", EMBEDDING_CALL_SECONDS) as attributes:
+            attributes.update(inputs=inputs, tokens=tokens)
+            yield attributes
+    except Exception:
+        EMBEDDING_ERRORS.inc()
+        raise
@@ -0,0 +1,281 @@
+"""
+Client-side scheduling of every OpenAI call the process makes.
+
+There is one scheduler per rate-limit pool (chat completions, embeddings).
+Each admits a call once it has a free concurrency slot and enough budget in
+its requests-per-minute and tokens-per-minute buckets. Waiting calls are
+admitted interactive first, then bulk (ingestion, see `bulk_priority`), in
+arrival order within a class.
+
+Concurrency adapts to the API (AIMD): a 429 halves the number of calls
+allowed in flight and pauses admission for the Retry-After period; every
+successful call grows the limit back by 1/limit, about one per window of
+calls. Identical calls made while one is still in flight share its result.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import openai
+
+from app.utils.config import Config
+from app.utils.metrics import OPENAI_COALESCED, OPENAI_QUEUE_SECONDS, OPENAI_RATE_LIMITED, register_collector
+
+LOG = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Failures retried with exponential backoff without touching the concurrency limit.
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+T = TypeVar("T")
+
+_priority: ContextVar[int] = ContextVar("openai_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_priority() -> Iterator[None]:
+    """OpenAI calls made in this block (and tasks started from it) yield to interactive ones."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def request_key(*parts: Any) -> str:
+    """Coalescing key of a call: identical parts mean an identical request."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text.
+    return len(text) // 4 + 1
+
+
+def estimate_chat_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt tokens plus the expected completion, charged before the call is made."""
+    return sum(estimate_tokens(m["content"]) for m in messages) + Config.OPENAI_COMPLETION_TOKENS_ESTIMATE
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    """Total tokens of a langchain chat response, when the API reported them."""
+    usage = getattr(response, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _retry_after(error: openai.RateLimitError) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return Config.OPENAI_RATE_LIMIT_BACKOFF_SECONDS
+
+
+class TokenBucket:
+    """Budget refilled continuously at `per_minute`; 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def wait_seconds(self, amount: float) -> float:
+        """Time until `amount` can be taken. Amounts above capacity only wait for a full bucket."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / self.capacity)
+
+    def take(self, amount: float):
+        """Spend `amount` (negative to give some back); the level may go below zero."""
+        if self.capacity:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class OpenAIScheduler:
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        # (priority, arrival, tokens, future) of calls waiting for admission
+        self._waiters: List[Any] = []
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Incremented on every backoff, so one burst of 429s only halves the limit once.
+        self._epoch = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[3].done())
+
+    def _dispatch(self):
+        """Admit waiting calls in priority order while slots and budget allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            future = self._waiters[0][3]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return
+            tokens = self._waiters[0][2]
+            wait = max(self._paused_until - time.monotonic(),
+                       self.requests.wait_seconds(1), self.tokens.wait_seconds(tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _throttle(self, epoch: int, retry_after: float):
+        OPENAI_RATE_LIMITED.inc(scheduler=self.name)
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        if epoch == self._epoch:
+            self._epoch += 1
+            self.limit = max(1.0, self.limit / 2)
+            LOG.warning("OpenAI %s rate limited: %d call(s) in flight allowed, pausing %.1fs",
+                        self.name, int(self.limit), retry_after)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, priority: int = None):
+        """
+        Hold one admitted call for the duration of the block.
+
+        Raising openai.RateLimitError from the block backs the scheduler off.
+        """
+        priority = _priority.get() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), tokens, future))
+        start = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        OPENAI_QUEUE_SECONDS.observe(time.perf_counter() - start, scheduler=self.name,
+                                     priority=PRIORITY_NAMES.get(priority, priority))
+
+        epoch = self._epoch
+        try:
+            yield
+        except openai.RateLimitError as e:
+            self._throttle(epoch, _retry_after(e))
+            raise
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        finally:
+            self._release()
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the tokens charged for a finished call by what it actually used."""
+        if actual is not None:
+            self.tokens.take(actual - estimated)
+
+    async def call(self, request: Callable[[], Awaitable[T]], tokens: int, key: str = None,
+                   usage: Callable[[T], Optional[int]] = None) -> T:
+        """
+        Run `request()` once admitted, retrying rate limits and transient failures.
+
+        Calls with the same `key` made while one is in flight await that one
+        instead. `usage` extracts the tokens actually used from the result.
+        """
+        if key is None:
+            return await self._call(request, tokens, usage)
+
+        shared = self._calls.get(key)
+        if shared is not None:
+            OPENAI_COALESCED.inc(scheduler=self.name)
+            return await asyncio.shield(shared)
+
+        task = asyncio.ensure_future(self._call(request, tokens, usage))
+        self._calls[key] = task
+
+        def forget(done: asyncio.Future):
+            self._calls.pop(key, None)
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    async def _call(self, request: Callable[[], Awaitable[T]], tokens: int,
+                    usage: Callable[[T], Optional[int]] = None) -> T:
+        attempts = Config.OPENAI_MAX_RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.slot(tokens):
+                    result = await request()
+                if usage:
+                    self.settle(tokens, usage(result))
+                return result
+            except openai.RateLimitError:
+                # The scheduler is paused now; waiting for a slot again is the backoff.
+                if attempt == attempts:
+                    raise
+            except TRANSIENT_ERRORS as e:
+                if attempt == attempts:
+                    raise
+                delay = Config.OPENAI_RATE_LIMIT_BACKOFF_SECONDS * 2 ** (attempt - 1) * (1 + random.random() * 0.25)
+                LOG.info("Retrying OpenAI %s call in %.1fs (attempt %d): %s", self.name, delay, attempt, str(e))
+                await asyncio.sleep(delay)
+
+
+chat_scheduler = OpenAIScheduler(
+    "chat", Config.OPENAI_CHAT_RPM, Config.OPENAI_CHAT_TPM, Config.OPENAI_CHAT_MAX_CONCURRENCY
+)
+embedding_scheduler = OpenAIScheduler(
+    "embeddings", Config.OPENAI_EMBEDDING_RPM, Config.OPENAI_EMBEDDING_TPM, Config.OPENAI_EMBEDDING_MAX_CONCURRENCY
+)
+
+
+def _collect_metrics():
+    schedulers = (chat_scheduler, embedding_scheduler)
+    return [
+        ("graphrag_openai_concurrency_limit", "gauge", "OpenAI calls the scheduler currently allows in flight.",
+         [({"scheduler": s.name}, s.limit) for s in schedulers]),
+        ("graphrag_openai_in_flight", "gauge", "OpenAI calls in flight.",
+         [({"scheduler": s.name}, s.in_flight) for s in schedulers]),
+        ("graphrag_openai_queued", "gauge", "OpenAI calls waiting for the scheduler.",
+         [({"scheduler": s.name}, s.queued) for s in schedulers]),
+    ]
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,192 @@
+"""
+Process-wide clients, created on first use and shared by every module.
+
+Heavy dependencies (LanceDB, langchain/OpenAI, transformers) are imported
+inside the factories, so importing the application stays cheap and a worker
+only pays for what it actually uses. `warm_up` loads them ahead of traffic.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.utils.config import Config
+
+LOG = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """A single shared instance built by `factory` on the first `get()`."""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    try:
+                        self._instance = self._factory()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.error = None
+                    self.load_seconds = time.perf_counter() - start
+                    LOG.info("Loaded %s in %.2fs", self.name, self.load_seconds)
+        return self._instance
+
+
+def _connect_db():
+    import lancedb
+
+    return lancedb.connect(Config.DATABASE_URL)
+
+
+def _load_tokenizer():
+    from transformers import GPT2TokenizerFast
+
+    return GPT2TokenizerFast.from_pretrained('gpt2')
+
+
+def _create_llm():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        openai_api_key=Config.OPENAI_API_KEY,
+        openai_api_base=Config.OPENAI_BASE_URL,
+        model_name="gpt-3.5-turbo",
+        temperature=0.7,
+        # Token usage on streamed answers, for the metrics.
+        stream_usage=True,
+        # Retries are made by app.utils.openai_scheduler, which needs to see the 429s.
+        max_retries=0
+    )
+
+
+def _create_embeddings_client():
+    import httpx
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        openai_api_key=Config.OPENAI_API_KEY,
+        openai_api_base=Config.OPENAI_BASE_URL,
+        model=Config.EMBEDDING_MODEL,
+        chunk_size=Config.EMBEDDING_BATCH_SIZE,
+        check_embedding_ctx_length=Config.EMBEDDING_CHECK_CTX_LENGTH,
+        max_retries=0,
+        http_async_client=httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=Config.OPENAI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.OPENAI_HTTP_MAX_KEEPALIVE
+        ))
+    )
+
+
+def _create_graph_service():
+    from app.services.graph_service import CustomGraphService
+
+    return CustomGraphService(api_key=Config.OPENAI_API_KEY)
+
+
+def _create_ingestion():
+    from app.services.ingestion import IngestionManager
+
+    return IngestionManager(get_graph_service())
+
+
+RESOURCES: Dict[str, LazyResource] = {
+    resource.name: resource for resource in (
+        LazyResource("db", _connect_db),
+        LazyResource("tokenizer", _load_tokenizer),
+        LazyResource("llm", _create_llm),
+        LazyResource("embeddings", _create_embeddings_client),
+        LazyResource("graph_service", _create_graph_service),
+        LazyResource("ingestion", _create_ingestion),
+    )
+}
+
+_ready = threading.Event()
+# Async LanceDB connection for request-time reads; opened on first use from the event loop.
+_async_db = None
+
+
+def get_db():
+    return RESOURCES["db"].get()
+
+
+async def get_async_db():
+    global _async_db
+    if _async_db is None:
+        import lancedb
+
+        _async_db = await lancedb.connect_async(Config.DATABASE_URL)
+    return _async_db
+
+
+def get_tokenizer():
+    return RESOURCES["tokenizer"].get()
+
+
+def get_llm():
+    """Chat model used to write answers."""
+    return RESOURCES["llm"].get()
+
+
+def get_embeddings_client():
+    return RESOURCES["embeddings"].get()
+
+
+def get_graph_service():
+    return RESOURCES["graph_service"].get()
+
+
+def get_ingestion():
+    return RESOURCES["ingestion"].get()
+
+
+def warm_up(names: Iterable[str] = None) -> bool:
+    """
+    Load the named resources (WARM_UP_RESOURCES by default) now.
+
+    Failures are logged, not raised; the process is marked ready only if every
+    resource loaded.
+    """
+    names = names if names is not None else Config.WARM_UP_RESOURCES
+    ok = True
+    for name in names:
+        try:
+            RESOURCES[name].get()
+        except Exception as e:
+            ok = False
+            LOG.error("Failed to warm up %s: %s", name, str(e))
+    if ok:
+        mark_ready()
+    return ok
+
+
+def mark_ready():
+    _ready.set()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def status() -> Dict[str, Any]:
+    return {
+        name: {
+            "loaded": resource.loaded,
+            "load_seconds": resource.load_seconds,
+            "error": resource.error
+        }
+        for name, resource in RESOURCES.items()
+    }
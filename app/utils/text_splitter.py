@@ -1,24 +1,142 @@
-from transformers import GPT2TokenizerFast
-
-tokenizer = GPT2TokenizerFast.from_pretrained('gpt2')
-
-def split_text(text, max_tokens=5000):
-    sentences = text.split('. ')
-    chunks = []
-    current_chunk = ''
-    current_tokens = 0
-
-    for sentence in sentences:
-        sentence_tokens = len(tokenizer.encode(sentence))
-        if current_tokens + sentence_tokens > max_tokens:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence + '. '
-            current_tokens = sentence_tokens
+import hashlib
+import re
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+from app.utils.config import Config
+from app.utils.resources import get_tokenizer
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n")
+# A chunk is only cut at a paragraph break if that keeps at least this share of max_tokens.
+_MIN_PARAGRAPH_FILL = 0.5
+
+
+def _break_tokens(pattern: re.Pattern, text: str, token_starts: List[int]) -> List[int]:
+    """
+    Token indices at which a chunk may start according to `pattern`: the first
+    token starting at or after each break. Bisecting on the start of the break
+    also covers tokenizers like GPT-2's whose tokens carry their leading space.
+    """
+    indices = {bisect_left(token_starts, match.start()) for match in pattern.finditer(text)}
+    return sorted(i for i in indices if 0 < i < len(token_starts))
+
+
+def _split_spans(text: str, max_tokens: int, overlap: int) -> List[Tuple[int, int]]:
+    """Tokenize `text` once and return the character spans of its chunks (see `_split_token_spans`)."""
+    offsets, spans = _split_token_spans(text, max_tokens, overlap)
+    return [(offsets[start][0], offsets[end - 1][1]) for start, end in spans]
+
+
+def _split_token_spans(text: str, max_tokens: int,
+                       overlap: int) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Tokenize `text` once and return its token offsets and the token spans of its chunks.
+
+    Chunks never exceed `max_tokens` tokens. Each one ends at the last
+    paragraph break that keeps it at least half full, else at the last
+    sentence break, else exactly at the cap. With `overlap`, the next chunk
+    starts up to `overlap` tokens before the previous end, snapped forward to
+    a sentence start when there is one.
+    """
+    encoding = get_tokenizer()(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = encoding['offset_mapping']
+    if not offsets:
+        return offsets, []
+
+    token_starts = [start for start, _ in offsets]
+    paragraphs = _break_tokens(_PARAGRAPH_BREAK, text, token_starts)
+    sentences = sorted(set(_break_tokens(_SENTENCE_BREAK, text, token_starts)) | set(paragraphs))
+
+    n_tokens = len(offsets)
+    spans = []
+    start = 0
+    while start < n_tokens:
+        limit = start + max_tokens
+        if limit >= n_tokens:
+            end = n_tokens
         else:
-            current_chunk += sentence + '. '
-            current_tokens += sentence_tokens
+            end = limit
+            paragraph = bisect_right(paragraphs, limit) - 1
+            sentence = bisect_right(sentences, limit) - 1
+            if paragraph >= 0 and paragraphs[paragraph] >= start + max_tokens * _MIN_PARAGRAPH_FILL:
+                end = paragraphs[paragraph]
+            elif sentence >= 0 and sentences[sentence] > start:
+                end = sentences[sentence]
+
+        spans.append((start, end))
+        if end >= n_tokens:
+            break
+
+        next_start = end
+        if overlap > 0:
+            next_start = max(end - overlap, start + 1)
+            snapped = bisect_left(sentences, next_start)
+            if snapped < len(sentences) and sentences[snapped] < end:
+                next_start = sentences[snapped]
+        start = next_start
+
+    return offsets, spans
+
+
+def iter_chunks(pieces: Iterable[str], max_tokens: int = 5000, overlap: int = None,
+                separator: str = '\n') -> Iterator[str]:
+    """
+    Chunk text that arrives in pieces (e.g. document elements as they are extracted).
+
+    Chunks are yielded as soon as enough text has been buffered that later
+    pieces cannot change them, so chunking overlaps with extraction instead of
+    waiting for `separator.join(pieces)`.
+    """
+    overlap = Config.CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    # Re-tokenize the buffer only once it probably holds a few chunks.
+    flush_chars = max_tokens * 4 * 3
+
+    buffer = ''
+    for piece in pieces:
+        buffer = buffer + separator + piece if buffer else piece
+        if len(buffer) < flush_chars:
+            continue
+        spans = _split_spans(buffer, max_tokens, overlap)
+        # The last span may still grow with the next piece; keep it buffered.
+        for start, end in spans[:-1]:
+            chunk = buffer[start:end].strip()
+            if chunk:
+                yield chunk
+        if len(spans) > 1:
+            buffer = buffer[spans[-1][0]:]
+
+    for start, end in _split_spans(buffer, max_tokens, overlap):
+        chunk = buffer[start:end].strip()
+        if chunk:
+            yield chunk
+
+
+def split_text(text, max_tokens=5000, overlap=None):
+    return list(iter_chunks([text], max_tokens=max_tokens, overlap=overlap))
+
+
+def split_passages(text: str, max_tokens: int) -> List[Tuple[str, int]]:
+    """
+    Split `text` into consecutive passages of at most `max_tokens` tokens, at
+    paragraph or sentence breaks where possible.
+
+    Returns:
+        List[Tuple[str, int]]: (passage, number of tokens) pairs, in order
+    """
+    offsets, spans = _split_token_spans(text, max_tokens, 0)
+    passages = []
+    for start, end in spans:
+        passage = text[offsets[start][0]:offsets[end - 1][1]].strip()
+        if passage:
+            passages.append((passage, end - start))
+    return passages
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text, add_special_tokens=False, verbose=False)['input_ids'])
 
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
 
-    return chunks
+def chunk_hash(text: str) -> str:
+    """Content fingerprint of a chunk; equal chunks of different uploads share their extraction and vector."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -0,0 +1,61 @@
+"""Deterministic synthetic documents and questions for benchmarks."""
+import random
+from typing import List
+
+PEOPLE = [
+    "Ada Lovelace", "Alan Turing", "Grace Hopper", "Claude Shannon", "John Neumann", "Edsger Dijkstra",
+    "Barbara Liskov", "Donald Knuth", "Frances Allen", "Tony Hoare", "Leslie Lamport", "Radia Perlman"
+]
+ORGANIZATIONS = [
+    "Analytical Society", "Bletchley Park", "Harvard Computation Lab", "Bell Labs", "Princeton Institute",
+    "Mathematical Centre", "Xerox Parc", "Stanford University", "Watson Research", "Oxford College"
+]
+CONCEPTS = [
+    "Algorithm", "Compiler", "Entropy", "Recursion", "Concurrency", "Cryptography", "Graph Theory",
+    "Type Systems", "Distributed Consensus", "Routing", "Formal Verification", "Information Theory"
+]
+VERBS = ["studied", "introduced", "improved", "explained", "applied", "questioned", "formalized", "taught"]
+FILLER = [
+    "the results were widely discussed", "this changed how students approached the subject",
+    "later work built directly on these ideas", "the early versions had several limitations",
+    "practical systems adopted the approach within a decade", "the proofs relied on careful induction"
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    person = rng.choice(PEOPLE)
+    concept = rng.choice(CONCEPTS)
+    organization = rng.choice(ORGANIZATIONS)
+    return f"{person} {rng.choice(VERBS)} {concept} at {organization}, and {rng.choice(FILLER)}."
+
+
+def generate_document(num_pages: int, paragraphs_per_page: int = 6, sentences_per_paragraph: int = 5,
+                      seed: int = 0) -> List[str]:
+    """
+    Return a document as a list of paragraphs, like the text elements of a converted PDF.
+
+    One page is roughly 500 tokens with the defaults.
+    """
+    rng = random.Random(seed)
+    return [
+        " ".join(_sentence(rng) for _ in range(sentences_per_paragraph))
+        for _ in range(num_pages * paragraphs_per_page)
+    ]
+
+
+def generate_questions(count: int, seed: int = 0) -> List[str]:
+    """Distinct questions mentioning entities that appear in generated documents."""
+    rng = random.Random(seed)
+    templates = [
+        "What did {person} contribute to {concept}?",
+        "How is {organization} related to {concept}?",
+        "Which ideas connect {person} and {organization}?",
+        "Explain the role of {concept} in the work of {person}.",
+    ]
+    questions = []
+    for i in range(count):
+        question = rng.choice(templates).format(
+            person=rng.choice(PEOPLE), concept=rng.choice(CONCEPTS), organization=rng.choice(ORGANIZATIONS)
+        )
+        questions.append(f"{question} (#{i})")
+    return questions
@@ -0,0 +1,223 @@
+"""
+Local stand-in for the OpenAI chat completions and embeddings APIs.
+
+Point the app at it with OPENAI_BASE_URL. Responses are deterministic:
+embeddings are hashed bag-of-words vectors (texts sharing words are similar),
+extraction prompts get entity/relation JSON built from the capitalized words
+of the chunk, and answer prompts get a canned answer of a fixed length.
+Latency is simulated per request and per generated token.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD = re.compile(r"\w+")
+_CAPITALIZED = re.compile(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+)*")
+
+
+class FakeOpenAISettings:
+    def __init__(self, dimension: int = 1536, latency_ms: float = 50.0, ms_per_token: float = 2.0,
+                 answer_tokens: int = 80, max_entities: int = 12, max_in_flight: int = 0):
+        self.dimension = dimension
+        # Fixed delay of every request, plus one step per generated (chat) or
+        # consumed (embeddings, /100) token.
+        self.latency_ms = latency_ms
+        self.ms_per_token = ms_per_token
+        self.answer_tokens = answer_tokens
+        self.max_entities = max_entities
+        # Requests beyond this many in flight get a 429, like a rate-limited
+        # account (0: never).
+        self.max_in_flight = max_in_flight
+
+
+@lru_cache(maxsize=200000)
+def _word_vector(word: str, dimension: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+
+def embed_text(text: str, dimension: int) -> np.ndarray:
+    """Deterministic unit vector: the normalized sum of per-word random vectors."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vector += _word_vector(word, dimension)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return _word_vector(text, dimension) / np.linalg.norm(_word_vector(text, dimension))
+    return vector / norm
+
+
+def extract_entities(text: str, max_entities: int) -> Dict[str, Any]:
+    names = list(dict.fromkeys(_CAPITALIZED.findall(text)))[:max_entities]
+    entities = [
+        {"id": str(i + 1), "name": name, "type": "Organization" if len(name.split()) > 1 else "Concept"}
+        for i, name in enumerate(names)
+    ]
+    relationships = [
+        {"source": str(i), "target": str(i + 1), "type": "related_to"}
+        for i in range(1, len(entities))
+    ]
+    return {"entities": entities, "relationships": relationships}
+
+
+def create_app(settings: FakeOpenAISettings) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = {"chat": 0, "embeddings": 0, "rate_limited": 0}
+    in_flight = 0
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        nonlocal in_flight
+        if settings.max_in_flight and in_flight >= settings.max_in_flight:
+            app.state.requests["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after-ms": "200"}
+            )
+        in_flight += 1
+        try:
+            return await call_next(request)
+        finally:
+            in_flight -= 1
+
+    async def delay(tokens: int = 0):
+        await asyncio.sleep((settings.latency_ms + settings.ms_per_token * tokens) / 1000)
+
+    def chat_reply(messages: List[Dict[str, Any]]) -> str:
+        prompt = messages[-1]["content"]
+        if "Text:" in prompt and "entities" in prompt:
+            text = prompt.split("Text:", 1)[1].split("Return the results in JSON format", 1)[0]
+            return json.dumps(extract_entities(text, settings.max_entities))
+        question = prompt.rsplit("Question:", 1)[-1].split("Instructions:", 1)[0].split()
+        words = (question or ["answer"]) * (settings.answer_tokens // max(len(question), 1) + 1)
+        return "Based on the document, " + " ".join(words[:settings.answer_tokens]) + "."
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests["chat"] += 1
+        body = await request.json()
+        reply = chat_reply(body["messages"])
+        tokens = reply.split(" ")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        usage = {"prompt_tokens": sum(len(m["content"]) // 4 for m in body["messages"]),
+                 "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            await delay(len(tokens))
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": usage
+            }
+
+        async def stream():
+            await delay()
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(settings.ms_per_token / 1000)
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": token if i == 0 else " " + token}}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": body["model"], "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        app.state.requests["embeddings"] += 1
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # Token-id inputs (the client's own tokenization) are embedded by their ids.
+        texts = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+        vectors = [embed_text(text, settings.dimension) for text in texts]
+        tokens = sum(len(text) // 4 for text in texts)
+        await delay(tokens // 100)
+
+        as_base64 = body.get("encoding_format") == "base64"
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [
+                {"object": "embedding", "index": i,
+                 "embedding": base64.b64encode(vector.tobytes()).decode() if as_base64 else vector.tolist()}
+                for i, vector in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    return app
+
+
+class FakeOpenAIServer:
+    """Runs the stand-in on a free local port in a background thread."""
+
+    def __init__(self, settings: FakeOpenAISettings = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or FakeOpenAISettings()
+        self.app = create_app(self.settings)
+        self.host = host
+        self.port = port or _free_port(host)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port,
+                                                     log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        deadline = time.time() + 10
+        while not self._server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Fake OpenAI server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def _free_port(host: str) -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the fake OpenAI API")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--ms-per-token", type=float, default=2.0)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--max-in-flight", type=int, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(FakeOpenAISettings(dimension=args.dimension, latency_ms=args.latency_ms,
+                                              ms_per_token=args.ms_per_token, max_in_flight=args.max_in_flight)),
+                host="127.0.0.1", port=args.port)
@@ -0,0 +1,264 @@
+"""
+Offline benchmark of ingestion and answering against the local OpenAI stand-in.
+
+    python -m benchmarks.run --pages 10,50 --concurrency 1,8,32 --requests 64
+
+For each corpus size this ingests a synthetic document stage by stage
+(convert, split, graph, embed, store, communities), times retrieval per question, then
+load-tests POST /answer at each concurrency level through the ASGI app.
+Results can be saved with --output and compared to a saved run with
+--baseline; the exit status is 1 when a p50/p99 or stage time regressed by
+more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import generate_document, generate_questions
+from benchmarks.fake_openai import FakeOpenAIServer, FakeOpenAISettings
+
+
+class Timings:
+    """Named lists of durations in seconds."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: summarize(values) for name, values in self.samples.items()}
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = np.asarray(values)
+    return {
+        "count": int(len(values)),
+        "total": float(values.sum()),
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p99": float(np.percentile(values, 99))
+    }
+
+
+def configure_environment(args: argparse.Namespace, server: FakeOpenAIServer, workdir: str):
+    """Point the app at the stand-in and a scratch database. Must run before `app` is imported."""
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": server.url,
+        "DATABASE_URL": os.path.join(workdir, "db"),
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding-cache"),
+        # The stand-in has no tiktoken vocabulary to offer; chunks are already size-capped.
+        "EMBEDDING_CHECK_CTX_LENGTH": "false",
+        "EMBEDDING_CACHE_ENABLED": str(args.with_caches).lower(),
+        "EXTRACTION_CACHE_ENABLED": str(args.with_caches).lower(),
+        "ANSWER_CACHE_ENABLED": str(args.with_caches).lower(),
+        "WARM_UP_ON_STARTUP": "false",
+        "PDF_CONVERTER_PREWARM": "false",
+    })
+
+
+async def ingest(document_id: str, elements: List[str], pdf: str = None) -> Dict[str, Any]:
+    from app.services.communities import build_communities
+    from app.services.document_store import register_document
+    from app.services.embeddings import create_embeddings
+    from app.services.graph_index import build_graph_index
+    from app.services.graph_store import save_graph
+    from app.utils.resources import get_graph_service, get_ingestion
+    from app.utils.config import Config
+    from app.utils.text_splitter import iter_chunks
+
+    timings = Timings()
+    if pdf:
+        with timings.measure("convert"):
+            elements = await get_ingestion().converter_pool.convert(pdf)
+
+    with timings.measure("split"):
+        chunks = await asyncio.to_thread(lambda: list(iter_chunks(elements)))
+    with timings.measure("graph"):
+        graph = await get_graph_service().create_knowledge_graph(document_id, chunks)
+    with timings.measure("embed"):
+        await create_embeddings(document_id, chunks)
+    with timings.measure("store"):
+        await asyncio.to_thread(save_graph, document_id, graph)
+        index = await build_graph_index(graph)
+    if Config.COMMUNITIES_ENABLED:
+        with timings.measure("communities"):
+            await build_communities(document_id, index)
+    await asyncio.to_thread(register_document, document_id, len(chunks), graph)
+
+    return {
+        "chunks": len(chunks),
+        "nodes": len(graph['nodes']),
+        "edges": len(graph['edges']),
+        "stages": {name: values[0] for name, values in timings.samples.items()}
+    }
+
+
+async def time_retrieval(document_id: str, questions: List[str]) -> Dict[str, float]:
+    from app.services.document_store import aget_document
+    from app.services.query_handler import search_similar_texts
+    from app.utils.embedding_utils import aget_embeddings
+
+    document = await aget_document(document_id)
+    vectors = await aget_embeddings(questions)
+    timings = Timings()
+    for vector in vectors:
+        with timings.measure("retrieve"):
+            await search_similar_texts(document_id, vector, num_chunks=document['num_chunks'])
+    return timings.summary()["retrieve"]
+
+
+async def load_test(document_id: str, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    """Send every question to POST /answer with at most `concurrency` requests in flight."""
+    import httpx
+    import main
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark",
+                                 timeout=None) as client:
+        async def ask(question: str):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/answer", json={"document_id": document_id, "query": question})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200 or response.json()["answer"].startswith("An error occurred"):
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(ask(question) for question in questions))
+        wall = time.perf_counter() - start
+
+    result = summarize(latencies)
+    result.update(concurrency=concurrency, errors=errors, requests_per_second=len(questions) / wall)
+    return result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.utils import resources
+
+    # Client construction (imports, tokenizer load) is not what the stages measure.
+    resources.warm_up(["db", "tokenizer", "llm", "embeddings", "graph_service"])
+
+    results = {"settings": vars(args), "corpora": []}
+    for pages in args.pages:
+        document_id = f"benchmark-{pages}"
+        elements = generate_document(pages, seed=pages)
+        ingestion = await ingest(document_id, elements, args.pdf)
+        questions = generate_questions(args.requests, seed=pages)
+
+        corpus = {
+            "pages": pages,
+            "ingestion": ingestion,
+            "retrieve": await time_retrieval(document_id, questions),
+            "answer": [await load_test(document_id, questions, c) for c in args.concurrency]
+        }
+        results["corpora"].append(corpus)
+        print_corpus(corpus)
+    return results
+
+
+def print_corpus(corpus: Dict[str, Any]):
+    ingestion = corpus["ingestion"]
+    print(f"\n== {corpus['pages']} pages: {ingestion['chunks']} chunks, "
+          f"{ingestion['nodes']} nodes, {ingestion['edges']} edges")
+    for name, seconds in ingestion["stages"].items():
+        print(f"  {name:<10} {seconds * 1000:10.1f} ms")
+    retrieve = corpus["retrieve"]
+    print(f"  {'retrieve':<10} p50 {retrieve['p50'] * 1000:8.1f} ms   p99 {retrieve['p99'] * 1000:8.1f} ms")
+    print(f"  {'answer':<10} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for load in corpus["answer"]:
+        print(f"  {'':<10} {load['concurrency']:>5} {load['requests_per_second']:>8.1f} "
+              f"{load['p50'] * 1000:>9.1f} {load['p99'] * 1000:>9.1f} {load['errors']:>7}")
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that got slower than `baseline` by more than `tolerance` (a fraction)."""
+    def metrics(run: Dict[str, Any]) -> Dict[str, float]:
+        flat = {}
+        for corpus in run["corpora"]:
+            prefix = f"{corpus['pages']}p"
+            for name, seconds in corpus["ingestion"]["stages"].items():
+                flat[f"{prefix} {name}"] = seconds
+            for stat in ("p50", "p99"):
+                flat[f"{prefix} retrieve {stat}"] = corpus["retrieve"][stat]
+                for load in corpus["answer"]:
+                    flat[f"{prefix} answer c={load['concurrency']} {stat}"] = load[stat]
+        return flat
+
+    current, previous = metrics(results), metrics(baseline)
+    return [
+        f"{name}: {previous[name] * 1000:.1f} ms -> {current[name] * 1000:.1f} ms"
+        for name in sorted(current.keys() & previous.keys())
+        if previous[name] > 0 and current[name] > previous[name] * (1 + tolerance)
+    ]
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=_int_list, default=[10, 50], help="corpus sizes, comma separated")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="comma separated")
+    parser.add_argument("--requests", type=int, default=64, help="questions per load test")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stand-in latency per request")
+    parser.add_argument("--ms-per-token", type=float, default=2.0, help="stand-in latency per token")
+    parser.add_argument("--dimension", type=int, default=1536, help="embedding dimension")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="stand-in answers 429 above this many concurrent requests")
+    parser.add_argument("--pdf", help="PDF to time the convert stage with (requires docling)")
+    parser.add_argument("--with-caches", action="store_true", help="keep the embedding, extraction and answer caches on")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(FakeOpenAISettings(
+        dimension=args.dimension, latency_ms=args.latency_ms, ms_per_token=args.ms_per_token,
+        max_in_flight=args.max_in_flight
+    )).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="graphrag-benchmark-") as workdir:
+            configure_environment(args, server, workdir)
+            results = asyncio.run(run(args))
+            results["fake_openai_requests"] = dict(server.app.state.requests)
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
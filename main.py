@@ -1,10 +1,85 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api import endpoints
+from app.utils import metrics, resources
+from app.utils.config import Config
 
 app = FastAPI()
 
+
+def _observe_request(request: Request, status: int, start: float):
+    # Route templates, not raw paths, keep the label set bounded.
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method, route=getattr(route, "path", "unmatched"), status=status
+    )
+
+
+async def _timed_body(body_iterator, request: Request, status: int, start: float):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        _observe_request(request, status, start)
+
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    start = time.perf_counter()
+    with metrics.trace(request.headers.get("x-request-id")):
+        try:
+            response = await call_next(request)
+        except Exception:
+            _observe_request(request, 500, start)
+            raise
+    # The body is sent after the middleware returns (an SSE stream for as long as
+    # the answer is generated), so the timer stops once the body is done.
+    response.body_iterator = _timed_body(response.body_iterator, request, response.status_code, start)
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "GraphRAG FastAPI is running!"}
 
+
+@app.get("/ready")
+async def ready():
+    """503 until the startup warm-up has loaded every shared client."""
+    body = {"ready": resources.is_ready(), "resources": resources.status()}
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 app.include_router(endpoints.router)
+
+
+@app.on_event("startup")
+async def startup():
+    # Warm-up runs in the background so the server accepts connections (and
+    # answers /ready) immediately.
+    if Config.WARM_UP_ON_STARTUP:
+        asyncio.create_task(asyncio.to_thread(resources.warm_up))
+    else:
+        resources.mark_ready()
+    if Config.PDF_CONVERTER_PREWARM:
+        # Loads the docling models in the worker processes without delaying startup.
+        asyncio.create_task(warm_up_converters())
+
+
+async def warm_up_converters():
+    ingestion = await asyncio.to_thread(resources.get_ingestion)
+    await ingestion.converter_pool.warm_up()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if resources.RESOURCES["ingestion"].loaded:
+        resources.get_ingestion().shutdown()
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Config reads the environment when it is first imported; point it at a scratch
+# database and keep startup from loading models.
+os.environ["DATABASE_URL"] = tempfile.mkdtemp(prefix="graphrag-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["WARM_UP_ON_STARTUP"] = "false"
+os.environ["PDF_CONVERTER_PREWARM"] = "false"
@@ -0,0 +1,25 @@
+import numpy as np
+
+from app.services.answer_cache import SemanticAnswerCache
+
+
+def _vector(i: int) -> np.ndarray:
+    vector = np.zeros(8, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def test_small_limit_evicts_the_least_recently_used_answer():
+    cache = SemanticAnswerCache(threshold=0.99, ttl_seconds=3600, max_per_document=3, max_documents=4)
+    for i in range(3):
+        cache.put("doc", "v1", _vector(i), f"a{i}")
+    # a0 is used again, so a1 is the least recently used when a3 arrives.
+    assert cache.get("doc", "v1", _vector(0)) == "a0"
+
+    cache.put("doc", "v1", _vector(3), "a3")
+    cache.put("doc", "v1", _vector(4), "a4")
+
+    assert cache.get("doc", "v1", _vector(1)) is None
+    assert cache.get("doc", "v1", _vector(2)) is None
+    assert [cache.get("doc", "v1", _vector(i)) for i in (0, 3, 4)] == ["a0", "a3", "a4"]
+    assert cache.stats()["entries"] == 3
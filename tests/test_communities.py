@@ -0,0 +1,30 @@
+import pytest
+
+from app.services.communities import is_global_query
+
+
+@pytest.mark.parametrize("query", [
+    "What is this document about?",
+    "What's the paper about?",
+    "Summarize the document",
+    "Can you give me a short overview of this paper?",
+    "What are the main topics of the report?",
+    "List the key takeaways",
+    "What is the overall message?",
+])
+def test_broad_questions_are_global(query):
+    assert is_global_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "What are the main findings of the second experiment?",
+    "Summarize the results of experiment 2",
+    "What was the overall accuracy on ImageNet?",
+    "What is the main argument against recursion?",
+    "Give me an overview of the training procedure",
+    "What is the key idea behind quicksort?",
+    "Who is the main character in chapter 2?",
+    "Who wrote the paper?",
+])
+def test_specific_questions_use_chunk_retrieval(query):
+    assert not is_global_query(query)
@@ -0,0 +1,75 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services import embeddings, query_handler
+from app.services.embeddings import COMPACT_COLUMNS, EMBEDDINGS_TABLE, SCALE_COLUMN, add_compact_vectors
+from app.services.index_manager import document_filter
+from app.utils.config import Config
+from app.utils.resources import get_db
+
+DIMENSION = 64
+NUM_CHUNKS = 300
+
+
+def _clustered_vectors(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((8, DIMENSION))
+    return (centers[rng.integers(0, 8, NUM_CHUNKS)] + 0.7 * rng.standard_normal((NUM_CHUNKS, DIMENSION))).astype(np.float32)
+
+
+def _store(monkeypatch, document_id: str, vectors: np.ndarray):
+    async def fake_embeddings(chunks):
+        return vectors
+
+    monkeypatch.setattr(embeddings, "aget_embeddings", fake_embeddings)
+    chunks = [f"{document_id} chunk {i}" for i in range(len(vectors))]
+    asyncio.run(embeddings.create_embeddings(document_id, chunks))
+
+
+def _top_chunks(document_id: str, queries: np.ndarray, top_n: int = 5):
+    results = asyncio.run(query_handler.retrieve_similar_texts_batch(
+        document_id, queries, top_n, NUM_CHUNKS, columns=["chunk_index"]
+    ))
+    return [[hit["chunk_index"] for hit in hits] for hits in results]
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    monkeypatch.setattr(Config, "VECTOR_COMPACT", "none")
+    vectors = _clustered_vectors(0)
+    _store(monkeypatch, "doc-compact", vectors)
+    return vectors
+
+
+def test_migration_adds_compact_columns_to_an_existing_table(stored):
+    assert COMPACT_COLUMNS["int8"] not in get_db().open_table(EMBEDDINGS_TABLE).schema.names
+
+    assert add_compact_vectors("int8") >= 1
+    table = get_db().open_table(EMBEDDINGS_TABLE)
+    assert COMPACT_COLUMNS["int8"] in table.schema.names
+    assert add_compact_vectors("int8") == 0
+
+    rows = table.search().where(document_filter("doc-compact")).select(
+        ["chunk_index", COMPACT_COLUMNS["int8"], SCALE_COLUMN]
+    ).limit(None).to_arrow().to_pylist()
+    assert len(rows) == NUM_CHUNKS
+    for row in rows:
+        unit = stored[row["chunk_index"]] / np.linalg.norm(stored[row["chunk_index"]])
+        restored = np.asarray(row[COMPACT_COLUMNS["int8"]], dtype=np.float32) * row[SCALE_COLUMN]
+        assert np.abs(restored - unit).max() < 0.01
+
+
+@pytest.mark.parametrize("kind", ["int8", "float16"])
+def test_compact_rerank_matches_the_float32_top_n(monkeypatch, stored, kind):
+    add_compact_vectors(kind)
+    queries = stored[:20] + np.random.default_rng(1).standard_normal((20, DIMENSION)).astype(np.float32)
+
+    expected = _top_chunks("doc-compact", queries)
+    monkeypatch.setattr(Config, "VECTOR_COMPACT", kind)
+    assert _top_chunks("doc-compact", queries) == expected
+
+    units = stored / np.linalg.norm(stored, axis=1, keepdims=True)
+    exact = np.argsort(-(queries @ units.T), axis=1)[:, :5]
+    assert expected == exact.tolist()
@@ -0,0 +1,50 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.communities import delete_communities
+from app.services.document_store import delete_document, get_document, register_document
+from app.services.graph_store import delete_graph, graph_cache, load_graph, save_graph
+from app.services.index_manager import document_filter
+from main import app
+
+INJECTED_ID = "nope' OR '1'='1"
+
+
+@pytest.fixture(scope="module")
+def client():
+    register_document("doc-1", 1, {})
+    return TestClient(app)
+
+
+def test_document_filter_quotes_the_id():
+    assert document_filter(INJECTED_ID) == "document_id = 'nope'' OR ''1''=''1'"
+
+
+def test_id_with_quote_matches_no_document(client):
+    assert get_document("doc-1") is not None
+    assert get_document(INJECTED_ID) is None
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/answer", {"document_id": INJECTED_ID, "query": "anything"}),
+    ("/answer/stream", {"document_id": INJECTED_ID, "query": "anything"}),
+    ("/answer/batch", {"document_id": INJECTED_ID, "queries": ["anything"]}),
+])
+def test_answer_with_quoted_id_returns_404(client, path, body):
+    assert client.post(path, json=body).status_code == 404
+
+
+def test_delete_with_quoted_id_leaves_other_documents(client):
+    save_graph("doc-1", {
+        'nodes': [{'id': "a", 'name': "A", 'type': "T", 'chunk_index': 0},
+                  {'id': "b", 'name': "B", 'type': "T", 'chunk_index': 0}],
+        'edges': [{'source': "a", 'target': "b", 'type': "r"}]
+    })
+    assert delete_document(INJECTED_ID) is False
+    delete_graph(INJECTED_ID)
+    delete_communities(INJECTED_ID)
+
+    graph_cache.invalidate("doc-1")
+    graph = load_graph("doc-1")
+    assert len(graph['nodes']) == 2 and len(graph['edges']) == 1
+    assert get_document("doc-1") is not None
@@ -0,0 +1,28 @@
+import numpy as np
+
+from app.utils.config import Config
+from app.utils.embedding_cache import EmbeddingCache, cache_key
+
+
+def _vectors(start: int, count: int):
+    return {cache_key(f"text {i}"): np.full(4, i, dtype=np.float32) for i in range(start, start + count)}
+
+
+def test_disk_tier_indexes_keys_and_compacts(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "SCALAR_INDEX_MIN_ROWS", 1)
+    monkeypatch.setattr(Config, "EMBEDDING_CACHE_COMPACT_EVERY", 3)
+    cache = EmbeddingCache(directory=str(tmp_path))
+
+    for write in range(2):
+        cache.put_many(_vectors(write * 5, 5))
+    table = cache._get_table()
+    assert [index.columns for index in table.list_indices()] == [["key"]]
+    assert table.stats()["fragment_stats"]["num_fragments"] == 2
+
+    cache.put_many(_vectors(10, 5))
+    assert table.stats()["fragment_stats"]["num_fragments"] == 1
+
+    fresh = EmbeddingCache(directory=str(tmp_path))
+    found = fresh.get_many(list(_vectors(0, 15)))
+    assert len(found) == 15
+    assert fresh.disk_hits == 15
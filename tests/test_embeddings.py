@@ -0,0 +1,23 @@
+import asyncio
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from app.services import embeddings
+from app.utils.resources import get_db
+from app.utils.text_splitter import chunk_hash
+
+
+def test_upload_to_an_unmigrated_table_asks_for_the_migration(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDINGS_TABLE", "legacy_embeddings")
+    legacy = pa.table({
+        "id": ["old_0"], "document_id": ["old"], "text": ["text"],
+        "vector": pa.array([[0.0, 1.0]], type=pa.list_(pa.float32(), 2)),
+        "knowledge_graph": ["{}"]
+    })
+    get_db().create_table("legacy_embeddings", legacy)
+
+    data = asyncio.run(embeddings.embed_document("new", ["text"], known={chunk_hash("text"): np.ones(2)}))
+    with pytest.raises(RuntimeError, match="app.services.migrations"):
+        embeddings.store_embeddings("new", data)
@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.services import entity_resolution
+from app.services.entity_resolution import normalize_entity_name, resolve_entities
+
+
+def _node(node_id, name, node_type="Person", chunk_index=0):
+    return {'id': node_id, 'name': name, 'type': node_type, 'chunk_index': chunk_index}
+
+
+def _edge(source, target, edge_type="KNOWS", weight=1.0):
+    return {'source': source, 'target': target, 'type': edge_type, 'weight': weight}
+
+
+def test_normalize_entity_name():
+    assert normalize_entity_name("  The Alan-Turing  Institute. ") == "alan turing institute"
+
+
+def test_same_name_and_type_merge_across_chunks():
+    graph = resolve_entities({'nodes': [
+        _node("n0", "Alan Turing", chunk_index=0),
+        _node("n1", "Bletchley Park", "Place", chunk_index=0),
+        _node("n2", "alan turing", chunk_index=3),
+        _node("n3", "Alan Turing.", chunk_index=1),
+    ], 'edges': []})
+
+    assert [node['id'] for node in graph['nodes']] == ["n0", "n1"]
+    turing = graph['nodes'][0]
+    assert turing['chunk_indices'] == [0, 1, 3]
+    assert turing['chunk_index'] == 0
+    assert turing['name'] == "Alan Turing"
+    assert graph['metadata']['unresolved_nodes'] == 4
+
+
+def test_nodes_of_different_types_never_merge():
+    nodes = [_node("n0", "Turing", "Person"), _node("n1", "Turing", "Machine"), _node("n2", "Turing test", "Person")]
+    vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    graph = resolve_entities({'nodes': nodes, 'edges': []}, vectors, similarity_threshold=0.9)
+    assert [node['id'] for node in graph['nodes']] == ["n0", "n1", "n2"]
+
+
+def test_similar_name_vectors_merge_within_a_type_across_blocks(monkeypatch):
+    monkeypatch.setattr(entity_resolution, "_BLOCK_SIZE", 2)
+    nodes = [_node(f"n{i}", name, chunk_index=i) for i, name in
+             enumerate(["A. Turing", "Grace Hopper", "Ada Lovelace", "Hopper", "Alan Turing"])]
+    vectors = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.1, 0.99, 0.0], [0.99, 0.1, 0.0]])
+
+    graph = resolve_entities({'nodes': nodes, 'edges': []}, vectors, similarity_threshold=0.95)
+
+    assert [(node['id'], node['chunk_indices']) for node in graph['nodes']] == [
+        ("n0", [0, 4]), ("n1", [1, 3]), ("n2", [2])
+    ]
+    assert resolve_entities({'nodes': nodes, 'edges': []}, vectors)['nodes'] == \
+        resolve_entities({'nodes': nodes, 'edges': []})['nodes']
+
+
+def test_edges_are_remapped_summed_and_merge_loops_dropped():
+    nodes = [_node("n0", "Alan Turing"), _node("n1", "Alonzo Church"), _node("n2", "alan turing", chunk_index=1)]
+    edges = [
+        _edge("n0", "n1"),
+        _edge("n2", "n1", weight=2.0),
+        _edge("n0", "n2", "SAME_AS"),
+        _edge("n1", "n1", "CITES"),
+    ]
+
+    graph = resolve_entities({'nodes': nodes, 'edges': edges})
+
+    assert graph['edges'] == [
+        {'source': "n0", 'target': "n1", 'type': "KNOWS", 'weight': 3.0},
+        {'source': "n1", 'target': "n1", 'type': "CITES", 'weight': 1.0},
+    ]
+    assert graph['metadata']['unresolved_edges'] == 4
@@ -0,0 +1,27 @@
+import asyncio
+
+import numpy as np
+
+from app.services import graph_index
+from app.services.graph_store import graph_cache, save_graph
+
+
+async def _fake_embeddings(texts):
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_load_graph_index_counts_one_lookup_per_call(monkeypatch):
+    monkeypatch.setattr(graph_index, "aget_embeddings", _fake_embeddings)
+    save_graph("doc-index", {
+        'nodes': [{'id': "a", 'name': "A", 'type': "T", 'chunk_index': 0},
+                  {'id': "b", 'name': "B", 'type': "T", 'chunk_index': 1}],
+        'edges': [{'source': "a", 'target': "b", 'type': "R"}]
+    })
+    graph_cache.invalidate("doc-index")
+    hits, misses = graph_cache.hits, graph_cache.misses
+
+    first = asyncio.run(graph_index.load_graph_index("doc-index"))
+    assert (graph_cache.hits - hits, graph_cache.misses - misses) == (0, 1)
+
+    assert asyncio.run(graph_index.load_graph_index("doc-index")) is first
+    assert (graph_cache.hits - hits, graph_cache.misses - misses) == (1, 1)
@@ -0,0 +1,73 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from app.services.index_manager import ensure_indexes
+from app.utils.config import Config
+from app.utils.resources import get_db
+
+DIMENSION = 32
+
+
+def _rows(start: int, count: int) -> pa.Table:
+    vectors = np.random.default_rng(start).random((count, DIMENSION), dtype=np.float32)
+    return pa.table({
+        "id": [str(i) for i in range(start, start + count)],
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(vectors.ravel()), DIMENSION)
+    })
+
+
+@pytest.fixture
+def small_thresholds(monkeypatch):
+    monkeypatch.setattr(Config, "SCALAR_INDEX_MIN_ROWS", 100)
+    monkeypatch.setattr(Config, "VECTOR_INDEX_MIN_ROWS", 200)
+    monkeypatch.setattr(Config, "VECTOR_INDEX_TYPE", "IVF_PQ")
+    monkeypatch.setattr(Config, "VECTOR_INDEX_REFRESH_FRACTION", 0.1)
+    monkeypatch.setattr(Config, "VECTOR_INDEX_RETRAIN_GROWTH", 2.0)
+
+
+def _vector_stats(table):
+    index = next(index for index in table.list_indices() if index.columns == ["vector"])
+    return table.index_stats(index.name)
+
+
+def _record(table, monkeypatch, method: str) -> list:
+    calls = []
+    original = getattr(table, method)
+    monkeypatch.setattr(table, method, lambda *args, **kwargs: calls.append(kwargs) or original(*args, **kwargs))
+    return calls
+
+
+def test_vector_index_is_retrained_after_growth(small_thresholds, monkeypatch):
+    table = get_db().create_table("index_retrain", _rows(0, 300), mode="overwrite")
+    ensure_indexes(table, ["id"])
+    assert _vector_stats(table).num_indexed_rows == 300
+
+    # Both indexes are stale; refreshing the scalar one must not hide that the ANN index outgrew its partitions.
+    table.add(_rows(300, 401))
+    optimize_calls = _record(table, monkeypatch, "optimize")
+    index_calls = _record(table, monkeypatch, "create_index")
+    ensure_indexes(table, ["id"])
+
+    assert len(index_calls) == 1 and index_calls[0]["num_partitions"] == 26
+    assert len(optimize_calls) == 1
+    stats = _vector_stats(table)
+    assert stats.num_indices == 1
+    assert stats.num_indexed_rows == 701
+    assert stats.num_unindexed_rows == 0
+
+
+def test_small_growth_is_folded_in_without_retraining(small_thresholds, monkeypatch):
+    table = get_db().create_table("index_refresh", _rows(0, 300), mode="overwrite")
+    ensure_indexes(table, ["id"])
+
+    table.add(_rows(300, 50))
+    optimize_calls = _record(table, monkeypatch, "optimize")
+    index_calls = _record(table, monkeypatch, "create_index")
+    ensure_indexes(table, ["id"])
+
+    assert index_calls == []
+    assert len(optimize_calls) == 1
+    stats = _vector_stats(table)
+    assert stats.num_indexed_rows == 350
+    assert stats.num_unindexed_rows == 0
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+
+from app.services import embeddings, ingestion
+from app.services.embeddings import EMBEDDINGS_TABLE
+from app.services.graph_service import GraphServiceException
+from app.services.index_manager import document_filter
+from app.services.ingestion import COMPLETED, FAILED, IngestionManager, InMemoryJobStore
+from app.utils.resources import get_db
+
+
+class FailingGraphService:
+    async def create_knowledge_graph(self, document_id, chunks, on_progress=None):
+        raise GraphServiceException("Entity extraction failed for every chunk")
+
+
+def _stored_rows(document_id: str) -> int:
+    if EMBEDDINGS_TABLE not in get_db().table_names():
+        return 0
+    return get_db().open_table(EMBEDDINGS_TABLE).count_rows(document_filter(document_id))
+
+
+async def _run_job(manager: IngestionManager):
+    job = await manager.submit("http://example.com/paper.pdf")
+    while (await manager.get(job['job_id']))['status'] not in (COMPLETED, FAILED):
+        await asyncio.sleep(0.01)
+    return await manager.get(job['job_id'])
+
+
+def test_failed_graph_extraction_stores_no_embeddings(monkeypatch):
+    monkeypatch.setattr(ingestion, "download_pdf", lambda url: ("missing.pdf", "failed-doc", "hash-1"))
+    # One chunk per paragraph; the real splitter needs the GPT-2 tokenizer.
+    monkeypatch.setattr(ingestion, "iter_chunks", iter)
+
+    async def embed(chunks, known):
+        return np.ones((len(chunks), 8), dtype=np.float32)
+
+    monkeypatch.setattr(embeddings, "_embed_chunks", embed)
+    manager = IngestionManager(FailingGraphService(), store=InMemoryJobStore(), process_workers=1)
+
+    async def convert(pdf_path):
+        return ["First paragraph of the paper.", "Second paragraph of the paper."]
+
+    monkeypatch.setattr(manager.converter_pool, "convert", convert)
+
+    job = asyncio.run(_run_job(manager))
+
+    assert job['status'] == FAILED
+    assert _stored_rows("failed-doc") == 0
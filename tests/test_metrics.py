@@ -0,0 +1,28 @@
+import asyncio
+
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.utils import metrics
+from main import app
+
+STREAM_SECONDS = 0.3
+
+
+@app.get("/test/slow-stream")
+async def slow_stream():
+    async def body():
+        yield "data: first\n\n"
+        await asyncio.sleep(STREAM_SECONDS)
+        yield "data: last\n\n"
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+def test_request_time_covers_the_streamed_body():
+    key = ("GET", "/test/slow-stream", "200")
+    response = TestClient(app).get("/test/slow-stream")
+    assert response.text.endswith("data: last\n\n")
+
+    counts, total = metrics.HTTP_REQUEST_SECONDS._values[key]
+    assert sum(counts) == 1
+    assert total >= STREAM_SECONDS
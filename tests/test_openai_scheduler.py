@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import httpx
+import openai
+
+from app.utils.config import Config
+from app.utils.openai_scheduler import OpenAIScheduler, bulk_priority
+
+
+def _rate_limit_error(retry_after_ms: int) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers={"retry-after-ms": str(retry_after_ms)})
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+async def _ok():
+    return "ok"
+
+
+def test_requests_per_minute_cap_delays_calls_past_the_budget():
+    scheduler = OpenAIScheduler("test", requests_per_minute=300, tokens_per_minute=0, max_concurrency=8)
+
+    async def run():
+        for _ in range(300):
+            await scheduler.call(_ok, tokens=1)
+        start = time.monotonic()
+        await scheduler.call(_ok, tokens=1)
+        return time.monotonic() - start
+
+    # The bucket refills 5 requests per second, so the 301st call waits ~0.2s.
+    assert asyncio.run(run()) >= 0.15
+
+
+def test_tokens_per_minute_cap_delays_calls_past_the_budget():
+    scheduler = OpenAIScheduler("test", requests_per_minute=0, tokens_per_minute=60000, max_concurrency=8)
+
+    async def run():
+        await scheduler.call(_ok, tokens=60000)
+        start = time.monotonic()
+        await scheduler.call(_ok, tokens=200)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.15
+
+
+def test_rate_limit_backs_off_then_recovers(monkeypatch):
+    monkeypatch.setattr(Config, "OPENAI_MAX_RETRIES", 2)
+    scheduler = OpenAIScheduler("test", requests_per_minute=0, tokens_per_minute=0, max_concurrency=4)
+    attempts = []
+
+    async def limited_once():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _rate_limit_error(100)
+        return "ok"
+
+    async def run():
+        assert await scheduler.call(limited_once, tokens=1) == "ok"
+        # Halved by the 429, then grown by 1/limit for the successful retry.
+        assert scheduler.limit == 2.5
+        for _ in range(10):
+            await scheduler.call(_ok, tokens=1)
+
+    asyncio.run(run())
+    assert attempts[1] - attempts[0] >= 0.09
+    assert scheduler.limit == 4.0
+    assert scheduler.in_flight == 0
+
+
+def test_interactive_calls_are_admitted_before_bulk_calls():
+    scheduler = OpenAIScheduler("test", requests_per_minute=0, tokens_per_minute=0, max_concurrency=1)
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocking():
+            await release.wait()
+            return "first"
+
+        def record(name):
+            async def request():
+                order.append(name)
+                return name
+            return request
+
+        first = asyncio.ensure_future(scheduler.call(blocking, tokens=1))
+        await asyncio.sleep(0)
+        with bulk_priority():
+            bulk = asyncio.ensure_future(scheduler.call(record("bulk"), tokens=1))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(scheduler.call(record("interactive"), tokens=1))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 2
+
+        release.set()
+        await asyncio.gather(first, bulk, interactive)
+
+    asyncio.run(run())
+    assert order == ["interactive", "bulk"]
+
+
+def test_identical_calls_in_flight_share_one_request():
+    scheduler = OpenAIScheduler("test", requests_per_minute=0, tokens_per_minute=0, max_concurrency=4)
+    runs = []
+
+    def request(name):
+        async def run():
+            runs.append(name)
+            await asyncio.sleep(0.05)
+            return name
+        return run
+
+    async def run():
+        return await asyncio.gather(
+            scheduler.call(request("a"), tokens=1, key="same"),
+            scheduler.call(request("b"), tokens=1, key="same"),
+            scheduler.call(request("c"), tokens=1, key="other")
+        )
+
+    assert asyncio.run(run()) == ["a", "a", "c"]
+    assert runs == ["a", "c"]
+
+
+def test_settle_corrects_the_estimated_tokens():
+    scheduler = OpenAIScheduler("test", requests_per_minute=0, tokens_per_minute=1000, max_concurrency=4)
+
+    async def run(actual):
+        return await scheduler.call(_ok, tokens=500, usage=lambda result: actual)
+
+    asyncio.run(run(100))
+    assert 899 <= scheduler.tokens.level <= 905
+
+    scheduler.tokens.level = 1000
+    asyncio.run(run(800))
+    assert 199 <= scheduler.tokens.level <= 205
+
+    scheduler.tokens.level = 1000
+    asyncio.run(run(None))
+    assert 499 <= scheduler.tokens.level <= 505
@@ -0,0 +1,69 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import pdf_processor
+from app.services.pdf_processor import ConverterPool
+
+
+class FakeConverter:
+    """Stands in for docling's DocumentConverter: fails on anything that is not a PDF."""
+
+    def convert(self, pdf_path, page_range=None):
+        with open(pdf_path, "rb") as f:
+            content = f.read()
+        if content == b"crash":
+            os._exit(1)
+        if not content.startswith(b"%PDF"):
+            raise RuntimeError("Input document is not valid")
+        body = [SimpleNamespace(text=line) for line in content.decode().splitlines()[1:]]
+        return SimpleNamespace(assembled=SimpleNamespace(body=body))
+
+
+def init_fake_converter():
+    # Runs in the spawned worker, so the worker's iter_pdf_text uses the fake.
+    pdf_processor._converter = FakeConverter()
+
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_processor, "init_converter_worker", init_fake_converter)
+    pool = ConverterPool(workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def _write(tmp_path, name: str, content: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_corrupt_pdf_fails_and_the_pool_keeps_converting(pool, tmp_path):
+    corrupt = _write(tmp_path, "corrupt.pdf", b"not a pdf")
+    valid = _write(tmp_path, "valid.pdf", b"%PDF-1.7\nFirst paragraph.\nSecond paragraph.")
+
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await pool.convert(corrupt)
+        assert error.value.status_code == 500
+        assert "Input document is not valid" in error.value.detail
+        return await pool.convert(valid)
+
+    assert asyncio.run(run()) == ["First paragraph.", "Second paragraph."]
+
+
+def test_pool_is_rebuilt_after_a_worker_dies(pool, tmp_path):
+    crash = _write(tmp_path, "crash.pdf", b"crash")
+    valid = _write(tmp_path, "valid.pdf", b"%PDF-1.7\nText.")
+
+    async def run():
+        with pytest.raises(HTTPException) as error:
+            await pool.convert(crash)
+        assert error.value.status_code == 500
+        return await pool.convert(valid)
+
+    assert asyncio.run(run()) == ["Text."]
@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from app.utils import text_splitter
+from app.utils.text_splitter import split_passages, split_text
+
+# GPT-2's pre-tokenization: words and punctuation carry their leading space.
+_GPT2_TOKEN = re.compile(r" ?[A-Za-z]+| ?\d+| ?[^\sA-Za-z\d]+|\s+(?!\S)|\s+")
+
+
+def gpt2_like_tokenizer(text, add_special_tokens=False, return_offsets_mapping=False, verbose=False):
+    offsets = [match.span() for match in _GPT2_TOKEN.finditer(text)]
+    return {'input_ids': list(range(len(offsets))), 'offset_mapping': offsets}
+
+
+@pytest.fixture(autouse=True)
+def tokenizer(monkeypatch):
+    monkeypatch.setattr(text_splitter, "get_tokenizer", lambda: gpt2_like_tokenizer)
+
+
+def _tokens(text: str) -> int:
+    return len(gpt2_like_tokenizer(text)['offset_mapping'])
+
+
+SENTENCES = [f"Sentence number {i} talks about things." for i in range(12)]
+
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = split_text(" ".join(SENTENCES), max_tokens=20, overlap=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("Sentence number")
+        assert chunk.endswith("things.")
+    assert " ".join(chunks) == " ".join(SENTENCES)
+
+
+def test_chunks_prefer_paragraph_breaks():
+    first = " ".join(SENTENCES[:3])
+    second = " ".join(SENTENCES[3:6])
+    chunks = split_text(f"{first}\n\n{second}", max_tokens=30, overlap=0)
+    assert chunks[0] == first
+
+
+def test_overlap_starts_at_a_sentence_of_the_previous_chunk():
+    chunks = split_text(" ".join(SENTENCES), max_tokens=20, overlap=8)
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        first_sentence = chunk[:chunk.index("things.") + len("things.")]
+        assert first_sentence in SENTENCES
+        assert previous.endswith(first_sentence)
+
+
+def test_chunks_never_exceed_the_token_cap():
+    text = " ".join(SENTENCES) + " " + " ".join(["word"] * 50)
+    for overlap in (0, 5):
+        chunks = split_text(text, max_tokens=16, overlap=overlap)
+        assert all(_tokens(chunk) <= 16 for chunk in chunks)
+    assert split_text(" ".join(["word"] * 50), max_tokens=16, overlap=0)[0] == " ".join(["word"] * 16)
+
+
+def test_split_passages_end_on_sentences_within_the_cap():
+    passages = split_passages(" ".join(SENTENCES), 20)
+    assert [passage for passage, _ in passages][0] == " ".join(SENTENCES[:2])
+    for passage, n_tokens in passages:
+        assert passage.endswith("things.")
+        assert n_tokens <= 20